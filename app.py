@@ -1,65 +1,20 @@
-import os
 import gradio as gr
 import asyncio
-from dotenv import load_dotenv
-from typing import Dict, List, Any, Optional, Tuple
-import json
 
-from models import OllamaModel, OpenAIModel, AnthropicModel, ModelResponse
-from utils.html_parser import clean_html
+from pipeline import (
+    anthropic_model,
+    metrics_snapshot,
+    openai_model,
+    process_click,
+    process_clicks,
+    warm_up_models,
+)
+from utils.profiling import install_profiling_triggers
 
-# Load environment variables
-load_dotenv()
+# Opt-in CPU/memory profile capture (SIGUSR1 or at startup)
+install_profiling_triggers()
 
-# Initialize models
-ollama_model = OllamaModel(model_name=os.getenv("OLLAMA_MODEL", "llama3.2"))
-
-# Initialize OpenAI and Anthropic models if API keys are provided
-openai_model = None
-anthropic_model = None
-
-if os.getenv("OPENAI_API_KEY"):
-    openai_model = OpenAIModel(
-        api_key=os.getenv("OPENAI_API_KEY"),
-        model_name=os.getenv("OPENAI_MODEL", "gpt-4o-mini")
-    )
-
-if os.getenv("ANTHROPIC_API_KEY"):
-    anthropic_model = AnthropicModel(
-        api_key=os.getenv("ANTHROPIC_API_KEY"),
-        model_name=os.getenv("ANTHROPIC_MODEL", "claude-3-opus-20240229")
-    )
-
-async def process_click(
-    html: str, 
-    button_text: str,
-    model_choice: str,
-    ultra_compact: bool
-) -> Tuple[Dict[str, Any], str, str, Optional[str]]:
-    """Process click data and determine monetary value."""
-    
-    # Clean HTML to reduce tokens
-    cleaned_html, original_size, new_size = clean_html(html, button_text, ultra_compact)
-    
-    # Create size reduction message
-    reduction_percent = ((original_size - new_size) / original_size) * 100 if original_size > 0 else 0
-    size_info = f"Original: {original_size:,} chars | Cleaned: {new_size:,} chars | Reduced by: {reduction_percent:.1f}%"
-    
-    # Select model based on user choice
-    if model_choice == "Ollama":
-        model = ollama_model
-    elif model_choice == "OpenAI" and openai_model:
-        model = openai_model
-    elif model_choice == "Anthropic" and anthropic_model:
-        model = anthropic_model
-    else:
-        return {"error": "Selected model is not available. Please check API keys or select Ollama."}, cleaned_html, size_info, None
-    
-    # Process with the selected model using cleaned HTML
-    result = await model.evaluate_click(cleaned_html, button_text)
-    
-    # Return the raw response as well
-    return result.to_dict(), cleaned_html, size_info, result.raw_response
+warm_up_models()
 
 # Set up Gradio interface
 with gr.Blocks(title="Click Value Analyzer") as app:
@@ -79,6 +34,11 @@ with gr.Blocks(title="Click Value Analyzer") as app:
                 placeholder="e.g., Add to Cart"
             )
             
+            page_url_input = gr.Textbox(
+                label="Page URL (optional)",
+                placeholder="e.g., https://shop.example.com/product/123"
+            )
+            
             with gr.Row():
                 # Available models dropdown
                 available_models = ["Ollama"]
@@ -120,6 +80,8 @@ with gr.Blocks(title="Click Value Analyzer") as app:
             ### Result Format
             - **value**: The monetary value (if detected with high confidence) or null
             - **currency**: The currency code (if detected with high confidence) or null
+            - **status**: `ok`, `no_value`, `timeout` or `error`
+            - **source**: `model`, `template` (learned template), `structured_data` (JSON-LD, microdata or meta tags) or `cache`
             """)
     
     with gr.Row():
@@ -130,9 +92,34 @@ with gr.Blocks(title="Click Value Analyzer") as app:
             interactive=False
         )
     
+    with gr.Accordion("Multiple Buttons (single model call)", open=False):
+        gr.Markdown("Evaluate several buttons of the page above at once. Uses the HTML, model and compact settings above.")
+        button_texts_input = gr.Textbox(
+            label="Button Texts (one per line)",
+            placeholder="Basic Plan\nPro Plan\nEnterprise Plan",
+            lines=4
+        )
+        analyze_multi_button = gr.Button("Analyze All Buttons")
+        multi_json_output = gr.JSON(label="Results per Button")
+        multi_size_info_output = gr.Textbox(label="HTML Size Reduction", interactive=False)
+        def analyze_multiple(html, texts, model, compact):
+            results, _, size_info = asyncio.run(process_clicks(html, texts.splitlines(), model, compact))
+            return results, size_info
+        
+        analyze_multi_button.click(
+            fn=analyze_multiple,
+            inputs=[html_input, button_texts_input, model_choice, ultra_compact_checkbox],
+            outputs=[multi_json_output, multi_size_info_output]
+        )
+    
+    with gr.Accordion("Metrics", open=False):
+        metrics_output = gr.JSON(label="Counters and Recent Events")
+        refresh_metrics_button = gr.Button("Refresh Metrics")
+        refresh_metrics_button.click(fn=metrics_snapshot, inputs=[], outputs=[metrics_output])
+    
     analyze_button.click(
-        fn=lambda html, text, model, compact: asyncio.run(process_click(html, text, model, compact)),
-        inputs=[html_input, button_text_input, model_choice, ultra_compact_checkbox],
+        fn=lambda html, text, model, compact, url: asyncio.run(process_click(html, text, model, compact, url)),
+        inputs=[html_input, button_text_input, model_choice, ultra_compact_checkbox, page_url_input],
         outputs=[json_output, processed_html_output, size_info_output, raw_response_output]
     )
 
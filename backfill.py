@@ -0,0 +1,86 @@
+"""
+Offline backfill through provider batch jobs.
+
+Input is a JSONL file with one {"custom_id", "html", "button_text"} object per line.
+Output is a JSONL file with the custom ID and the ModelResponse fields for each click.
+
+    python backfill.py clicks.jsonl results.jsonl --provider openai
+
+Re-running on the same input resumes the submitted jobs instead of submitting again.
+"""
+import argparse
+import asyncio
+import json
+import os
+
+from dotenv import load_dotenv
+
+from models import AnthropicModel, OpenAIModel
+from models.batch import AnthropicBatchBackend, OpenAIBatchBackend
+from utils.html_parser import clean_html
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description="Evaluate clicks in bulk through provider batch jobs")
+    parser.add_argument("input", help="JSONL file with custom_id, html and button_text")
+    parser.add_argument("output", help="JSONL file to write results to")
+    parser.add_argument("--provider", choices=["openai", "anthropic"], default="openai")
+    parser.add_argument("--state", help="Resumable job state file (default: derived from the input file name)")
+    parser.add_argument("--poll-interval", type=float, default=30.0)
+    parser.add_argument("--no-ultra-compact", action="store_true", help="Use standard instead of ultra-compact cleaning")
+    args = parser.parse_args()
+
+    load_dotenv()
+
+    if not args.state:
+        name = os.path.splitext(os.path.basename(args.input))[0]
+        args.state = os.path.join(".cache", f"batch_state-{args.provider}-{name}.json")
+
+    if args.provider == "openai":
+        model = OpenAIModel(
+            api_key=os.getenv("OPENAI_API_KEY"),
+            model_name=os.getenv("OPENAI_MODEL", "gpt-4o-mini")
+        )
+        backend = OpenAIBatchBackend(model, args.state, args.poll_interval)
+    else:
+        model = AnthropicModel(
+            api_key=os.getenv("ANTHROPIC_API_KEY"),
+            model_name=os.getenv("ANTHROPIC_MODEL", "claude-3-opus-20240229")
+        )
+        backend = AnthropicBatchBackend(model, args.state, args.poll_interval)
+
+    with open(args.input, "r", encoding="utf-8") as f:
+        rows = [json.loads(line) for line in f if line.strip()]
+
+    # Report IDs the provider would reject before spending time on cleaning
+    problems = backend.invalid_custom_ids([row.get("custom_id") for row in rows])
+    if problems:
+        for problem in problems[:20]:
+            print(problem)
+        if len(problems) > 20:
+            print(f"... and {len(problems) - 20} more")
+        raise SystemExit(f"Error: {len(problems)} invalid custom IDs in {args.input} (items are numbered by non-empty line)")
+
+    items = []
+    for row in rows:
+        cleaned_html, _, _ = clean_html(row["html"], row["button_text"], not args.no_ultra_compact)
+        items.append({
+            "custom_id": row["custom_id"],
+            "html": cleaned_html,
+            "button_text": row["button_text"],
+            "ultra_compact": not args.no_ultra_compact,
+        })
+
+    try:
+        results = await backend.run(items)
+    except ValueError as e:
+        raise SystemExit(f"Error: {str(e)}")
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        for custom_id, response in results.items():
+            f.write(json.dumps({"custom_id": custom_id, **response.to_dict()}) + "\n")
+    print(f"Wrote {len(results)} results to {args.output}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,123 @@
+"""
+Benchmark HTML cleaning variants on size and, optionally, model accuracy.
+
+Cases come from the built-in examples or a JSONL file with
+{"html", "button_text", "value", "currency"} per line.
+
+    python benchmark.py                      # size only, built-in examples
+    python benchmark.py --cases clicks.jsonl --model openai
+"""
+from typing import Any, Dict, List, Optional
+import argparse
+import asyncio
+import json
+import os
+
+from dotenv import load_dotenv
+
+from examples.click_examples import EXAMPLES
+from prompts.click_value import get_prompt_stats
+from utils.html_parser import clean_html
+
+# Cleaning variants compared by the benchmark
+VARIANTS = {
+    "no_pruning": {"prune_hidden_elements": False},
+    "prune_hidden": {"prune_hidden_elements": True},
+}
+
+
+def load_cases(path: Optional[str]) -> List[Dict[str, Any]]:
+    """Load benchmark cases, defaulting to the prompt examples."""
+    if not path:
+        return [
+            {
+                "html": example["html"],
+                "button_text": example["button_text"],
+                "value": example["response"]["value"],
+                "currency": example["response"]["currency"],
+            }
+            for example in EXAMPLES
+        ]
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def create_model(name: str):
+    """Create the model selected on the command line from environment settings."""
+    from models import AnthropicModel, OllamaModel, OpenAIModel
+
+    if name == "ollama":
+        return OllamaModel(model_name=os.getenv("OLLAMA_MODEL", "llama3.2"))
+    if name == "openai":
+        return OpenAIModel(api_key=os.getenv("OPENAI_API_KEY"), model_name=os.getenv("OPENAI_MODEL", "gpt-4o-mini"))
+    return AnthropicModel(api_key=os.getenv("ANTHROPIC_API_KEY"), model_name=os.getenv("ANTHROPIC_MODEL", "claude-3-opus-20240229"))
+
+
+def is_correct(response, case: Dict[str, Any]) -> bool:
+    """Compare a model response with the expected value and currency."""
+    expected_value = case.get("value")
+    if expected_value is None or response.value is None:
+        value_ok = expected_value is None and response.value is None
+    else:
+        value_ok = abs(response.value - float(expected_value)) < 0.01
+    return value_ok and response.currency == case.get("currency")
+
+
+async def run_variant(name: str, options: Dict[str, Any], cases: List[Dict[str, Any]], ultra_compact: bool, model) -> Dict[str, Any]:
+    """Clean every case with one variant and optionally score the model on the result."""
+    original_total = cleaned_total = correct = 0
+    for case in cases:
+        cleaned_html, original_size, new_size = clean_html(case["html"], case["button_text"], ultra_compact, **options)
+        original_total += original_size
+        cleaned_total += new_size
+        if model is not None:
+            response = await model.evaluate_click(cleaned_html, case["button_text"], ultra_compact=ultra_compact)
+            correct += is_correct(response, case)
+
+    return {
+        "variant": name,
+        "original_chars": original_total,
+        "cleaned_chars": cleaned_total,
+        "reduction_percent": round((original_total - cleaned_total) / original_total * 100, 1) if original_total else 0.0,
+        "accuracy": round(correct / len(cases), 3) if model is not None and cases else None,
+    }
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark HTML cleaning size and accuracy")
+    parser.add_argument("--cases", help="JSONL file with html, button_text, value and currency")
+    parser.add_argument("--model", choices=["ollama", "openai", "anthropic"], help="Also measure accuracy with this model")
+    parser.add_argument("--no-ultra-compact", action="store_true", help="Use standard instead of ultra-compact cleaning")
+    args = parser.parse_args()
+
+    load_dotenv()
+    cases = load_cases(args.cases)
+    model = create_model(args.model) if args.model else None
+
+    results = []
+    for name, options in VARIANTS.items():
+        results.append(await run_variant(name, options, cases, not args.no_ultra_compact, model))
+
+    print(f"{len(cases)} cases")
+    print(f"{'variant':<16}{'original':>10}{'cleaned':>10}{'reduced':>10}{'accuracy':>10}")
+    for r in results:
+        accuracy = "-" if r["accuracy"] is None else f"{r['accuracy']:.3f}"
+        print(f"{r['variant']:<16}{r['original_chars']:>10,}{r['cleaned_chars']:>10,}{r['reduction_percent']:>9.1f}%{accuracy:>10}")
+
+    baseline = results[0]
+    for r in results[1:]:
+        saved = baseline["cleaned_chars"] - r["cleaned_chars"]
+        line = f"{r['variant']} vs {baseline['variant']}: {saved:,} fewer chars"
+        if r["accuracy"] is not None:
+            line += f", accuracy {r['accuracy'] - baseline['accuracy']:+.3f}"
+        print(line)
+
+    stats = get_prompt_stats(not args.no_ultra_compact)
+    print(
+        f"system prompt v{stats['prompt_version']}: {stats['chars']:,} chars vs {stats['raw_chars']:,} with raw examples "
+        f"({stats['saved_chars']:,} chars, ~{stats['saved_tokens']:,} tokens saved per request)"
+    )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,9 +1,11 @@
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Any, Tuple
 import json
 import re
 from anthropic import AsyncAnthropic
-from .base import BaseModel, ModelResponse
-from prompts.click_value import get_system_prompt, get_user_prompt
+from .base import BaseModel, ModelResponse, STATUS_ERROR, STATUS_TIMEOUT
+from utils.deadline import CallPolicy, Deadline, is_timeout_error
+from utils.profiling import stage
+from prompts.click_value import MAX_OUTPUT_TOKENS, RESPONSE_SCHEMA, get_system_prompt, get_user_prompt
 
 class AnthropicModel(BaseModel):
     """Interface for Anthropic Claude models."""
@@ -12,104 +14,125 @@ class AnthropicModel(BaseModel):
         self, 
         api_key: str,
         model_name: str = "claude-3-opus-20240229", 
+        call_policy: Optional[CallPolicy] = None,
     ):
+        super().__init__(call_policy)
         self.model_name = model_name
-        self.client = AsyncAnthropic(api_key=api_key)
+        # Timeouts and retries are handled per attempt by the call policy
+        self.client = AsyncAnthropic(api_key=api_key, max_retries=0)
     
     async def evaluate_click(
         self, 
         html: str, 
-        button_text: str
+        button_text: str,
+        deadline: Optional[Deadline] = None,
+        hint: Optional[str] = None,
+        ultra_compact: bool = True
     ) -> ModelResponse:
         """Determine the monetary value of a click using Anthropic Claude model."""
-        system_prompt = get_system_prompt()
-        user_prompt = get_user_prompt(html, button_text)
+        with stage("build_prompt"):
+            system_prompt = get_system_prompt(ultra_compact)
+            user_prompt = get_user_prompt(html, button_text, hint)
+        request = self._build_request(system_prompt, user_prompt)
         
         try:
-            response = await self.client.messages.create(
-                model=self.model_name,
-                messages=[
-                    {"role": "user", "content": user_prompt}
-                ],
-                system=system_prompt
+            response = await self.call_policy.run(
+                lambda timeout: self.client.messages.create(**request, timeout=timeout),
+                deadline
             )
             
-            try:
-                # Extract content from the response
-                content = response.content[0].text
-                
-                # Try to find JSON in the response
-                json_match = re.search(r'```json\s*(.*?)\s*```', content, re.DOTALL)
-                if json_match:
-                    json_str = json_match.group(1)
-                else:
-                    # If no JSON block found, try to parse the entire content
-                    json_str = content
-                
-                output = json.loads(json_str)
-                
-                # Validate and parse fields
-                value = self._parse_number(output.get("value"))
-                currency = self._parse_currency(output.get("currency"))
-                
-                return ModelResponse(
-                    value=value,
-                    currency=currency,
-                    raw_response=content
-                )
-            except (json.JSONDecodeError, KeyError, AttributeError) as e:
-                print(f"Error parsing response: {str(e)}")
-                raw_response = response.content[0].text if hasattr(response, 'content') and response.content else str(response)
-                return ModelResponse(raw_response=raw_response)
+            return self._parse_message(response.content)
                 
         except Exception as e:
             print(f"Error calling Anthropic API: {str(e)}")
-            return ModelResponse()
+            return ModelResponse(status=STATUS_TIMEOUT if is_timeout_error(e) else STATUS_ERROR)
+    
+    async def _complete_json(
+        self,
+        system_prompt: str,
+        user_prompt: str,
+        schema_name: str,
+        schema: Dict[str, Any],
+        max_tokens: int,
+        deadline: Optional[Deadline] = None
+    ) -> Tuple[Any, str]:
+        """Run a schema-constrained completion and return (parsed JSON, raw text)."""
+        request = self._build_request(system_prompt, user_prompt, schema_name, schema, max_tokens)
+        response = await self.call_policy.run(
+            lambda timeout: self.client.messages.create(**request, timeout=timeout),
+            deadline
+        )
+        for block in response.content:
+            if getattr(block, "type", None) == "tool_use":
+                return block.input, json.dumps(block.input)
+        raise ValueError(f"No tool call in response: {response.content}")
     
-    def _parse_number(self, value: Any) -> Optional[float]:
-        """Parse a numeric value, handling various formats."""
-        if value is None:
-            return None
-        if isinstance(value, (int, float)):
-            return float(value)
-        if isinstance(value, str):
-            try:
-                # Remove commas from numbers like "1,234.56"
-                cleaned = value.replace(',', '')
-                return float(cleaned)
-            except ValueError:
-                return None
-        return None
+    def _build_request(
+        self,
+        system_prompt: str,
+        user_prompt: str,
+        schema_name: str = "click_value",
+        schema: Dict[str, Any] = RESPONSE_SCHEMA,
+        max_tokens: int = MAX_OUTPUT_TOKENS
+    ) -> Dict[str, Any]:
+        """Build the Messages API parameters (shared with the batch backend)."""
+        # Forcing the tool makes Claude reply with schema-shaped input and nothing else
+        tool_name = f"report_{schema_name}"
+        return {
+            "model": self.model_name,
+            "max_tokens": max_tokens,
+            "messages": [
+                {"role": "user", "content": user_prompt}
+            ],
+            "system": system_prompt,
+            "tools": [
+                {
+                    "name": tool_name,
+                    "description": "Report the monetary value of the clicked button(s).",
+                    "input_schema": schema
+                }
+            ],
+            "tool_choice": {"type": "tool", "name": tool_name}
+        }
     
-    def _parse_currency(self, value: Any) -> Optional[str]:
-        """Parse a currency code, handling various formats."""
-        if value is None:
-            return None
-        if isinstance(value, str):
-            # Currency symbols to codes
-            currency_map = {
-                "$": "USD",
-                "€": "EUR",
-                "£": "GBP",
-                "¥": "JPY",
-                "₹": "INR",
-                "dollars": "USD",
-                "euros": "EUR",
-                "pounds": "GBP",
-                "yen": "JPY",
-                "rupees": "INR",
-                "shekels": "ILS",
-            }
+    def _parse_message(self, content_blocks: Any) -> ModelResponse:
+        """Parse the content blocks of a reply, preferring the forced tool call."""
+        try:
+            for block in content_blocks:
+                if getattr(block, "type", None) == "tool_use":
+                    output = block.input
+                    return ModelResponse(
+                        value=self._parse_number(output.get("value")),
+                        currency=self._parse_currency(output.get("currency")),
+                        raw_response=json.dumps(output)
+                    )
+            # Fall back to the text reply
+            return self._parse_content(content_blocks[0].text)
+        except (AttributeError, IndexError, TypeError):
+            return ModelResponse(raw_response=str(content_blocks), status=STATUS_ERROR)
+    
+    def _parse_content(self, content: str) -> ModelResponse:
+        """Parse the text of a model reply into a ModelResponse."""
+        try:
+            # Try to find JSON in the response
+            json_match = re.search(r'```json\s*(.*?)\s*```', content, re.DOTALL)
+            if json_match:
+                json_str = json_match.group(1)
+            else:
+                # If no JSON block found, try to parse the entire content
+                json_str = content
             
-            # Clean the value
-            value = value.strip()
+            output = json.loads(json_str)
             
-            # Check for symbol mapping
-            if value in currency_map:
-                return currency_map[value]
+            # Validate and parse fields
+            value = self._parse_number(output.get("value"))
+            currency = self._parse_currency(output.get("currency"))
             
-            # Check if it's already a 3-letter code
-            if len(value) == 3 and value.isalpha():
-                return value.upper()
-        
-        return None 
\ No newline at end of file
+            return ModelResponse(
+                value=value,
+                currency=currency,
+                raw_response=content
+            )
+        except (json.JSONDecodeError, KeyError, AttributeError) as e:
+            print(f"Error parsing response: {str(e)}")
+            return ModelResponse(raw_response=content, status=STATUS_ERROR)
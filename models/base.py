@@ -1,6 +1,15 @@
 from abc import ABC, abstractmethod
-from typing import Dict, Optional, Union, List, Any
+from typing import Dict, Optional, Union, List, Any, Tuple
 import json
+from utils.deadline import CallPolicy, Deadline, is_timeout_error
+from utils.profiling import stage
+from prompts.click_value import MULTI_RESPONSE_SCHEMA, get_multi_max_tokens, get_system_prompt, get_multi_user_prompt
+
+# Result statuses: a value was found, the model found no value, or the call failed
+STATUS_OK = "ok"
+STATUS_NO_VALUE = "no_value"
+STATUS_TIMEOUT = "timeout"
+STATUS_ERROR = "error"
 
 class ModelResponse:
     """Structured response from LLM models."""
@@ -9,11 +18,19 @@ class ModelResponse:
         self, 
         value: Optional[float] = None, 
         currency: Optional[str] = None,
-        raw_response: Optional[str] = None
+        raw_response: Optional[str] = None,
+        status: Optional[str] = None,
+        source: str = "model"
     ):
         self.value = self._validate_value(value)
         self.currency = self._validate_currency(currency)
         self.raw_response = raw_response
+        # Default status distinguishes "value found" from "no value found"
+        if status is None:
+            status = STATUS_OK if self.value is not None else STATUS_NO_VALUE
+        self.status = status
+        # Which stage produced the answer (e.g. "model" or "template")
+        self.source = source
     
     def _validate_value(self, value: Any) -> Optional[float]:
         """Validate that value is a number or None."""
@@ -63,7 +80,9 @@ class ModelResponse:
         return json.dumps({
             "value": self.value,
             "currency": self.currency,
-            "raw_response": self.raw_response
+            "raw_response": self.raw_response,
+            "status": self.status,
+            "source": self.source
         })
     
     def to_dict(self) -> Dict:
@@ -71,17 +90,158 @@ class ModelResponse:
         return {
             "value": self.value,
             "currency": self.currency,
-            "raw_response": self.raw_response
+            "raw_response": self.raw_response,
+            "status": self.status,
+            "source": self.source
         }
 
 class BaseModel(ABC):
     """Base class for all LLM models."""
     
+    def __init__(self, call_policy: Optional[CallPolicy] = None):
+        self.call_policy = call_policy or CallPolicy()
+    
     @abstractmethod
     async def evaluate_click(
         self, 
         html: str, 
-        button_text: str
+        button_text: str,
+        deadline: Optional[Deadline] = None,
+        hint: Optional[str] = None,
+        ultra_compact: bool = True
     ) -> ModelResponse:
-        """Determine the monetary value of a click."""
-        pass 
\ No newline at end of file
+        """Determine the monetary value of a click, optionally guided by a structured-data hint (ultra_compact: the cleaning mode of the HTML)."""
+        pass
+    
+    @abstractmethod
+    async def _complete_json(
+        self,
+        system_prompt: str,
+        user_prompt: str,
+        schema_name: str,
+        schema: Dict[str, Any],
+        max_tokens: int,
+        deadline: Optional[Deadline] = None
+    ) -> Tuple[Any, str]:
+        """Run a schema-constrained completion and return (parsed JSON, raw text); raises on failure."""
+        pass
+    
+    async def evaluate_clicks(
+        self,
+        html: str,
+        button_texts: List[str],
+        deadline: Optional[Deadline] = None,
+        hint: Optional[str] = None,
+        ultra_compact: bool = True
+    ) -> List[ModelResponse]:
+        """
+        Determine the monetary values of several buttons on the same page in a single model call.
+        
+        Returns:
+            One ModelResponse per button text, in the same order
+        """
+        with stage("build_prompt"):
+            system_prompt = get_system_prompt(ultra_compact)
+            user_prompt = get_multi_user_prompt(html, button_texts, hint)
+        
+        try:
+            output, raw_response = await self._complete_json(
+                system_prompt,
+                user_prompt,
+                "click_values",
+                MULTI_RESPONSE_SCHEMA,
+                get_multi_max_tokens(len(button_texts)),
+                deadline
+            )
+        except Exception as e:
+            print(f"Error evaluating multiple buttons: {str(e)}")
+            status = STATUS_TIMEOUT if is_timeout_error(e) else STATUS_ERROR
+            return [ModelResponse(status=status) for _ in button_texts]
+        
+        return self._split_results(output, button_texts, raw_response)
+    
+    def _parse_number(self, value: Any) -> Optional[float]:
+        """Parse a numeric value, handling various formats."""
+        if value is None:
+            return None
+        if isinstance(value, (int, float)):
+            return float(value)
+        if isinstance(value, str):
+            try:
+                # Remove commas from numbers like "1,234.56"
+                cleaned = value.replace(',', '')
+                return float(cleaned)
+            except ValueError:
+                return None
+        return None
+    
+    def _parse_currency(self, value: Any) -> Optional[str]:
+        """Parse a currency code, handling various formats."""
+        if value is None:
+            return None
+        if isinstance(value, str):
+            # Currency symbols to codes
+            currency_map = {
+                "$": "USD",
+                "€": "EUR",
+                "£": "GBP",
+                "¥": "JPY",
+                "₹": "INR",
+                "dollars": "USD",
+                "euros": "EUR",
+                "pounds": "GBP",
+                "yen": "JPY",
+                "rupees": "INR",
+                "shekels": "ILS",
+            }
+            
+            # Clean the value
+            value = value.strip()
+            
+            # Check for symbol mapping
+            if value in currency_map:
+                return currency_map[value]
+            
+            # Check if it's already a 3-letter code
+            if len(value) == 3 and value.isalpha():
+                return value.upper()
+        
+        return None
+    
+    def _split_results(self, output: Any, button_texts: List[str], raw_response: str) -> List[ModelResponse]:
+        """Fan a multi-button answer back out into one ModelResponse per button."""
+        results = output.get("results", []) if isinstance(output, dict) else []
+        by_text: Dict[str, List[int]] = {}
+        for index, entry in enumerate(results):
+            if isinstance(entry, dict) and isinstance(entry.get("button_text"), str):
+                by_text.setdefault(" ".join(entry["button_text"].split()).lower(), []).append(index)
+        
+        # Match by echoed text first, so an entry is never given to two buttons
+        matched: List[Optional[int]] = []
+        used = set()
+        for button_text in button_texts:
+            indices = by_text.get(" ".join(button_text.split()).lower(), [])
+            index = indices.pop(0) if indices else None
+            matched.append(index)
+            if index is not None:
+                used.add(index)
+        
+        responses = []
+        for position, index in enumerate(matched):
+            if (index is None and len(results) == len(button_texts) and position not in used
+                    and isinstance(results[position], dict)):
+                # Fall back to position when the model didn't echo the text exactly
+                # and the answer has exactly one unused entry per button at that spot
+                index = position
+                used.add(index)
+            if index is None:
+                responses.append(ModelResponse(raw_response=raw_response, status=STATUS_ERROR))
+                continue
+            entry = results[index]
+            # Providers share the same lenient number/currency parsing
+            responses.append(ModelResponse(
+                value=self._parse_number(entry.get("value")),
+                currency=self._parse_currency(entry.get("currency")),
+                raw_response=raw_response
+            ))
+        return responses 
\ No newline at end of file
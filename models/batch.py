@@ -0,0 +1,319 @@
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional
+import asyncio
+import hashlib
+import json
+import os
+import re
+import time
+
+from .base import ModelResponse, STATUS_ERROR, STATUS_TIMEOUT
+from .anthropic import AnthropicModel
+from .openai import OpenAIModel
+from prompts.click_value import get_system_prompt, get_user_prompt
+
+
+def input_fingerprint(custom_ids: List[str]) -> str:
+    """Hash of the submitted custom IDs, used to tie a state file to its input."""
+    return hashlib.sha256("\n".join(custom_ids).encode("utf-8")).hexdigest()
+
+
+class BatchJobState:
+    """Resumable state of a backfill, persisted as JSON so an interrupted run can pick up where it stopped."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.provider: Optional[str] = None
+        self.input_hash: Optional[str] = None
+        # One entry per submitted provider job: {"job_id", "custom_ids", "status", "submitted_at", "done"}
+        self.jobs: List[Dict[str, Any]] = []
+        self.results: Dict[str, Dict[str, Any]] = {}
+        self.load()
+
+    def load(self) -> None:
+        """Load state from disk if a previous run left it behind."""
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        self.provider = data.get("provider")
+        self.input_hash = data.get("input_hash")
+        self.jobs = data.get("jobs", [])
+        self.results = data.get("results", {})
+
+    def save(self) -> None:
+        """Write state to disk atomically."""
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({
+                "provider": self.provider,
+                "input_hash": self.input_hash,
+                "jobs": self.jobs,
+                "results": self.results,
+            }, f)
+        os.replace(tmp_path, self.path)
+
+    def responses(self, custom_ids: List[str]) -> Dict[str, ModelResponse]:
+        """Rebuild ModelResponse objects from the stored result dictionaries, in input order."""
+        return {custom_id: ModelResponse(**self.results[custom_id]) for custom_id in custom_ids}
+
+
+class BatchBackend(ABC):
+    """
+    Base class for provider batch-job backends.
+
+    Items are dictionaries with "custom_id", "html" (already cleaned), "button_text" and
+    optionally "ultra_compact" (the cleaning mode, default True).
+    Results are mapped back to ModelResponse objects by custom ID. Inputs larger than
+    the provider's per-batch limits are split over several jobs.
+    """
+
+    provider = ""
+    # Per-batch provider limits
+    max_requests = 0
+    max_bytes = 0
+    # Custom IDs the provider accepts (any non-empty string unless a backend is stricter)
+    custom_id_pattern = re.compile(r".+", re.DOTALL)
+
+    def __init__(self, state_path: str, poll_interval: float = 30.0):
+        self.state = BatchJobState(state_path)
+        self.poll_interval = poll_interval
+
+    def _prompts(self, item: Dict[str, Any]) -> Dict[str, str]:
+        return {
+            "system_prompt": get_system_prompt(item.get("ultra_compact", True)),
+            "user_prompt": get_user_prompt(item["html"], item["button_text"], item.get("hint")),
+        }
+
+    @abstractmethod
+    def _request(self, item: Dict[str, Any]) -> Dict[str, Any]:
+        """Build the provider batch request entry for one item."""
+        pass
+
+    @abstractmethod
+    async def _submit(self, requests: List[Dict[str, Any]]) -> str:
+        """Submit request entries as one provider batch job and return its ID."""
+        pass
+
+    @abstractmethod
+    async def _poll(self, job_id: str) -> str:
+        """Return the provider status of the job."""
+        pass
+
+    @abstractmethod
+    def _is_finished(self, status: str) -> bool:
+        """Whether the provider status is terminal."""
+        pass
+
+    @abstractmethod
+    async def _fetch_results(self, job: Dict[str, Any]) -> Dict[str, ModelResponse]:
+        """Download results of a finished job keyed by custom ID."""
+        pass
+
+    def invalid_custom_ids(self, custom_ids: List[Any]) -> List[str]:
+        """
+        Describe custom IDs the provider would reject, so they can be reported before submitting.
+
+        Returns:
+            One message per problem (bad format or duplicate), empty if all IDs are fine
+        """
+        problems = []
+        seen = set()
+        for index, custom_id in enumerate(custom_ids, 1):
+            if not isinstance(custom_id, str) or not self.custom_id_pattern.match(custom_id):
+                problems.append(f"item {index}: custom ID {custom_id!r} must match {self.custom_id_pattern.pattern}")
+            elif custom_id in seen:
+                problems.append(f"item {index}: duplicate custom ID {custom_id!r}")
+            seen.add(custom_id)
+        return problems
+
+    def _chunks(self, items: List[Dict[str, Any]]) -> List[List[Dict[str, Any]]]:
+        """Group request entries into jobs that stay under the provider's count and size limits."""
+        chunks: List[List[Dict[str, Any]]] = []
+        current: List[Dict[str, Any]] = []
+        current_bytes = 0
+        for item in items:
+            request = self._request(item)
+            size = len(json.dumps(request).encode("utf-8")) + 1
+            if current and (len(current) >= self.max_requests or current_bytes + size > self.max_bytes):
+                chunks.append(current)
+                current, current_bytes = [], 0
+            current.append(request)
+            current_bytes += size
+        if current:
+            chunks.append(current)
+        return chunks
+
+    async def run(self, items: List[Dict[str, Any]]) -> Dict[str, ModelResponse]:
+        """
+        Submit (or resume) the batch jobs, wait for them to finish and return the results.
+
+        Every submitted custom ID gets a response; items missing from the provider
+        output come back with an error status.
+        """
+        custom_ids = [item["custom_id"] for item in items]
+        problems = self.invalid_custom_ids(custom_ids)
+        if problems:
+            raise ValueError(f"{len(problems)} invalid custom IDs, first: {problems[0]}")
+        input_hash = input_fingerprint(custom_ids)
+
+        if self.state.jobs:
+            if self.state.provider != self.provider:
+                raise ValueError(f"State file {self.state.path} belongs to a {self.state.provider} backfill")
+            if self.state.input_hash != input_hash:
+                raise ValueError(
+                    f"State file {self.state.path} belongs to a different input; "
+                    "use another --state file or delete it to start over"
+                )
+            print(f"Resuming {len(self.state.jobs)} {self.provider} batch job(s)")
+        self.state.provider = self.provider
+        self.state.input_hash = input_hash
+
+        # Submit whatever a previous run didn't get to, saving after every job
+        submitted = {custom_id for job in self.state.jobs for custom_id in job["custom_ids"]}
+        pending = [item for item in items if item["custom_id"] not in submitted]
+        for requests in self._chunks(pending):
+            job_id = await self._submit(requests)
+            self.state.jobs.append({
+                "job_id": job_id,
+                "custom_ids": [request["custom_id"] for request in requests],
+                "status": None,
+                "submitted_at": time.time(),
+                "done": False,
+            })
+            self.state.save()
+            print(f"Submitted {self.provider} batch {job_id} with {len(requests)} requests")
+
+        while True:
+            for job in self.state.jobs:
+                if job["done"]:
+                    continue
+                job["status"] = await self._poll(job["job_id"])
+                if self._is_finished(job["status"]):
+                    responses = await self._fetch_results(job)
+                    for custom_id in job["custom_ids"]:
+                        response = responses.get(custom_id) or ModelResponse(status=STATUS_ERROR)
+                        self.state.results[custom_id] = response.to_dict()
+                    job["done"] = True
+                self.state.save()
+            if all(job["done"] for job in self.state.jobs):
+                break
+            await asyncio.sleep(self.poll_interval)
+
+        return self.state.responses(custom_ids)
+
+
+class OpenAIBatchBackend(BatchBackend):
+    """Backend for the OpenAI Batch API (JSONL input file on /v1/chat/completions)."""
+
+    provider = "openai"
+    # 50,000 requests / 200 MB input file per batch (with some headroom on the size)
+    max_requests = 50_000
+    max_bytes = 190 * 1024 * 1024
+
+    def __init__(self, model: OpenAIModel, state_path: str, poll_interval: float = 30.0):
+        super().__init__(state_path, poll_interval)
+        self.model = model
+        # job ID -> (output file ID, error file ID), re-read on every poll so resuming works
+        self._files: Dict[str, Any] = {}
+
+    def _request(self, item: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "custom_id": item["custom_id"],
+            "method": "POST",
+            "url": "/v1/chat/completions",
+            "body": self.model._build_request(**self._prompts(item)),
+        }
+
+    async def _submit(self, requests: List[Dict[str, Any]]) -> str:
+        lines = [json.dumps(request) for request in requests]
+        input_file = await self.model.client.files.create(
+            file=("batch_input.jsonl", "\n".join(lines).encode("utf-8")),
+            purpose="batch"
+        )
+        batch = await self.model.client.batches.create(
+            input_file_id=input_file.id,
+            endpoint="/v1/chat/completions",
+            completion_window="24h"
+        )
+        return batch.id
+
+    async def _poll(self, job_id: str) -> str:
+        batch = await self.model.client.batches.retrieve(job_id)
+        self._files[job_id] = (batch.output_file_id, batch.error_file_id)
+        return batch.status
+
+    def _is_finished(self, status: str) -> bool:
+        return status in ("completed", "failed", "expired", "cancelled")
+
+    async def _fetch_results(self, job: Dict[str, Any]) -> Dict[str, ModelResponse]:
+        responses: Dict[str, ModelResponse] = {}
+        for file_id in self._files.get(job["job_id"], (None, None)):
+            if not file_id:
+                continue
+            content = await self.model.client.files.content(file_id)
+            for line in content.text.splitlines():
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                response = entry.get("response") or {}
+                if entry.get("error") or response.get("status_code") != 200:
+                    responses[entry["custom_id"]] = ModelResponse(raw_response=json.dumps(entry), status=STATUS_ERROR)
+                    continue
+                try:
+                    content_text = response["body"]["choices"][0]["message"]["content"]
+                except (KeyError, IndexError, TypeError):
+                    responses[entry["custom_id"]] = ModelResponse(raw_response=json.dumps(entry), status=STATUS_ERROR)
+                    continue
+                responses[entry["custom_id"]] = self.model._parse_content(content_text)
+        if job["status"] == "expired":
+            # Requests the provider never got to are reported as timeouts
+            for custom_id in job["custom_ids"]:
+                responses.setdefault(custom_id, ModelResponse(status=STATUS_TIMEOUT))
+        return responses
+
+
+class AnthropicBatchBackend(BatchBackend):
+    """Backend for the Anthropic Message Batches API."""
+
+    provider = "anthropic"
+    # 100,000 requests / 256 MB per batch (with some headroom on the size)
+    max_requests = 100_000
+    max_bytes = 240 * 1024 * 1024
+    custom_id_pattern = re.compile(r"^[a-zA-Z0-9_-]{1,64}$")
+
+    def __init__(self, model: AnthropicModel, state_path: str, poll_interval: float = 30.0):
+        super().__init__(state_path, poll_interval)
+        self.model = model
+
+    def _request(self, item: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "custom_id": item["custom_id"],
+            "params": self.model._build_request(**self._prompts(item)),
+        }
+
+    async def _submit(self, requests: List[Dict[str, Any]]) -> str:
+        batch = await self.model.client.messages.batches.create(requests=requests)
+        return batch.id
+
+    async def _poll(self, job_id: str) -> str:
+        batch = await self.model.client.messages.batches.retrieve(job_id)
+        return batch.processing_status
+
+    def _is_finished(self, status: str) -> bool:
+        return status == "ended"
+
+    async def _fetch_results(self, job: Dict[str, Any]) -> Dict[str, ModelResponse]:
+        responses: Dict[str, ModelResponse] = {}
+        async for entry in await self.model.client.messages.batches.results(job["job_id"]):
+            result = entry.result
+            if result.type == "succeeded":
+                responses[entry.custom_id] = self.model._parse_message(result.message.content)
+            elif result.type == "expired":
+                responses[entry.custom_id] = ModelResponse(status=STATUS_TIMEOUT)
+            else:
+                responses[entry.custom_id] = ModelResponse(raw_response=str(result), status=STATUS_ERROR)
+        return responses
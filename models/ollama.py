@@ -1,38 +1,229 @@
 import ollama
-from typing import Dict, List, Optional, Any
-import json
+from typing import Dict, List, Optional, Any, Sequence, Tuple
 import asyncio
-from .base import BaseModel, ModelResponse
-from prompts.click_value import get_system_prompt, get_user_prompt
+import json
+import os
+import re
+import time
+import weakref
+from .base import BaseModel, ModelResponse, STATUS_ERROR, STATUS_TIMEOUT
+from utils.deadline import CallPolicy, Deadline, is_timeout_error
+from utils.profiling import stage
+from utils.metrics import METRICS
+from prompts.click_value import MAX_OUTPUT_TOKENS, RESPONSE_SCHEMA, get_system_prompt, get_user_prompt
+
+# Context sizes we switch between; a few fixed buckets avoid reloading the model
+# for every slightly different prompt length
+DEFAULT_NUM_CTX_BUCKETS = (4096, 8192, 16384, 32768)
+
+# Rough prompt size estimate and room left for the generated answer
+CHARS_PER_TOKEN = 3.5
+OUTPUT_TOKEN_RESERVE = 256
+
+# A load_duration above this means the model was (re)loaded for the request
+MODEL_LOAD_THRESHOLD_SECONDS = 0.5
+
+# Consecutive requests fitting a smaller bucket before the context is shrunk again
+DEFAULT_SHRINK_AFTER = 20
+
+DURATION_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+
+
+def parse_keep_alive(keep_alive: str) -> float:
+    """Seconds Ollama keeps the model loaded for a keep_alive value ("30m", "1h30m", "300"; negative means forever)."""
+    keep_alive = str(keep_alive).strip()
+    try:
+        seconds = float(keep_alive)
+    except ValueError:
+        parts = re.findall(r"(-?[\d.]+)(ms|h|m|s)", keep_alive)
+        if not parts:
+            return float("inf")
+        seconds = sum(float(number) * DURATION_UNITS[unit] for number, unit in parts)
+    return float("inf") if seconds < 0 else seconds
+
+# Warm-up context size: the system prompt (~1.4k tokens) plus a typical cleaned page
+# don't fit the smallest bucket, and loading at a smaller size than the first
+# request needs would only cause a reload
+DEFAULT_WARMUP_NUM_CTX = 8192
 
 class OllamaModel(BaseModel):
     """Interface for Ollama models."""
     
-    def __init__(self, model_name: str = "llama3.2", base_url: str = "http://localhost:11434"):
+    def __init__(
+        self,
+        model_name: str = "llama3.2",
+        base_url: str = "http://localhost:11434",
+        call_policy: Optional[CallPolicy] = None,
+        keep_alive: Optional[str] = None,
+        num_ctx_buckets: Optional[Sequence[int]] = None,
+        shrink_after: Optional[int] = None,
+    ):
+        super().__init__(call_policy)
         self.model_name = model_name
         self.base_url = base_url
-        ollama.base_url = base_url  # Set the base URL directly
+        # How long Ollama keeps the model resident after a request (e.g. "30m"; a negative duration such as "-1m" keeps it loaded)
+        self.keep_alive = keep_alive or os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+        self.num_ctx_buckets = sorted(num_ctx_buckets or DEFAULT_NUM_CTX_BUCKETS)
+        self._loaded_num_ctx: Optional[int] = None
+        self._last_used: Optional[float] = None
+        # Requests in a row that would have fit a smaller bucket than the loaded one
+        self.shrink_after = shrink_after or int(os.getenv("OLLAMA_CTX_SHRINK_AFTER", str(DEFAULT_SHRINK_AFTER)))
+        self._small_streak = 0
+        # Async clients (so timed-out calls are actually cancelled) bound to the
+        # event loop they were created in; the app runs each request in its own loop
+        self._clients = weakref.WeakKeyDictionary()
     
-    async def evaluate_click(
-        self, 
-        html: str, 
-        button_text: str
-    ) -> ModelResponse:
-        """Determine the monetary value of a click using Ollama model."""
-        system_prompt = get_system_prompt()
-        user_prompt = get_user_prompt(html, button_text)
+    @property
+    def client(self) -> ollama.AsyncClient:
+        """Ollama client for the running event loop."""
+        loop = asyncio.get_running_loop()
+        client = self._clients.get(loop)
+        if client is None:
+            client = ollama.AsyncClient(host=self.base_url)
+            self._clients[loop] = client
+        return client
+    
+    def _num_ctx_for(self, system_prompt: str, user_prompt: str) -> int:
+        """
+        Pick the context size for a prompt.
+        
+        Uses the smallest bucket that fits the prompt plus the answer. A smaller bucket
+        than the loaded one would reload the model, so the loaded size is kept until
+        `shrink_after` requests in a row fit a smaller bucket, or until the model has
+        likely been unloaded anyway (idle for longer than keep_alive).
+        """
+        needed = int((len(system_prompt) + len(user_prompt)) / CHARS_PER_TOKEN) + OUTPUT_TOKEN_RESERVE
+        fitting = next((bucket for bucket in self.num_ctx_buckets if bucket >= needed), None)
+        if fitting is None:
+            METRICS.increment("ollama_context_overflow")
+            fitting = self.num_ctx_buckets[-1]
+        
+        loaded = self._loaded_num_ctx
+        if loaded is None or fitting >= loaded:
+            self._small_streak = 0
+            return fitting
+        
+        unloaded = self._last_used is not None and time.monotonic() - self._last_used > parse_keep_alive(self.keep_alive)
+        self._small_streak += 1
+        if unloaded or self._small_streak >= self.shrink_after:
+            self._small_streak = 0
+            return fitting
+        return loaded
+    
+    def _track_load(self, response: Any, num_ctx: int) -> None:
+        """Record model load and eviction events reported by Ollama."""
+        load_seconds = (response.get("load_duration") or 0) / 1e9
+        if load_seconds >= MODEL_LOAD_THRESHOLD_SECONDS:
+            if self._loaded_num_ctx is None:
+                reason = "cold_start"
+            elif self._loaded_num_ctx != num_ctx:
+                reason = "context_resize"
+            else:
+                # Same settings but the model had to be loaded again
+                reason = "evicted"
+                METRICS.record_event("ollama_model_evicted", model=self.model_name)
+            METRICS.record_event(
+                "ollama_model_loaded",
+                model=self.model_name,
+                num_ctx=num_ctx,
+                reason=reason,
+                load_seconds=round(load_seconds, 3)
+            )
+        self._loaded_num_ctx = num_ctx
+        self._last_used = time.monotonic()
+    
+    async def warm_up(self, num_ctx: Optional[int] = None, timeout: Optional[float] = None) -> bool:
+        """
+        Preload the model so the first real request doesn't pay the load time.
+        
+        Args:
+            num_ctx: Context size to load with (default OLLAMA_WARMUP_NUM_CTX, rounded up to a bucket)
+            timeout: Seconds to wait for the load (default OLLAMA_WARMUP_TIMEOUT) so an unresponsive host can't block startup
         
+        Returns:
+            True if the model was loaded successfully
+        """
+        num_ctx = num_ctx or int(os.getenv("OLLAMA_WARMUP_NUM_CTX", str(DEFAULT_WARMUP_NUM_CTX)))
+        num_ctx = next((bucket for bucket in self.num_ctx_buckets if bucket >= num_ctx), self.num_ctx_buckets[-1])
+        timeout = timeout if timeout is not None else float(os.getenv("OLLAMA_WARMUP_TIMEOUT", "60"))
         try:
-            # Use asyncio.to_thread to make synchronous ollama library call non-blocking
-            response = await asyncio.to_thread(
-                ollama.chat,
+            # An empty prompt only loads the model into memory
+            response = await asyncio.wait_for(
+                self.client.generate(
+                    model=self.model_name,
+                    prompt="",
+                    keep_alive=self.keep_alive,
+                    options={"num_ctx": num_ctx}
+                ),
+                timeout
+            )
+            self._track_load(response, num_ctx)
+            return True
+        except asyncio.TimeoutError:
+            print(f"Error warming up Ollama model: no response within {timeout:.0f}s")
+            return False
+        except Exception as e:
+            print(f"Error warming up Ollama model: {str(e)}")
+            return False
+    
+    async def _complete_json(
+        self,
+        system_prompt: str,
+        user_prompt: str,
+        schema_name: str,
+        schema: Dict[str, Any],
+        max_tokens: int,
+        deadline: Optional[Deadline] = None
+    ) -> Tuple[Any, str]:
+        """Run a schema-constrained completion and return (parsed JSON, raw text)."""
+        num_ctx = self._num_ctx_for(system_prompt, user_prompt)
+        response = await self.call_policy.run(
+            lambda timeout: self.client.chat(
                 model=self.model_name,
                 messages=[
                     {"role": "system", "content": system_prompt},
                     {"role": "user", "content": user_prompt}
                 ],
-                format="json"
+                format=schema,
+                keep_alive=self.keep_alive,
+                options={"num_ctx": num_ctx, "num_predict": max_tokens}
+            ),
+            deadline
+        )
+        self._track_load(response, num_ctx)
+        raw_response = response["message"]["content"]
+        return json.loads(raw_response), raw_response
+    
+    async def evaluate_click(
+        self, 
+        html: str, 
+        button_text: str,
+        deadline: Optional[Deadline] = None,
+        hint: Optional[str] = None,
+        ultra_compact: bool = True
+    ) -> ModelResponse:
+        """Determine the monetary value of a click using Ollama model."""
+        with stage("build_prompt"):
+            system_prompt = get_system_prompt(ultra_compact)
+            user_prompt = get_user_prompt(html, button_text, hint)
+        num_ctx = self._num_ctx_for(system_prompt, user_prompt)
+        
+        try:
+            response = await self.call_policy.run(
+                lambda timeout: self.client.chat(
+                    model=self.model_name,
+                    messages=[
+                        {"role": "system", "content": system_prompt},
+                        {"role": "user", "content": user_prompt}
+                    ],
+                    # Schema-constrained decoding keeps the reply to the bare answer
+                    format=RESPONSE_SCHEMA,
+                    keep_alive=self.keep_alive,
+                    options={"num_ctx": num_ctx, "num_predict": MAX_OUTPUT_TOKENS}
+                ),
+                deadline
             )
+            self._track_load(response, num_ctx)
             
             # Parse model output
             try:
@@ -53,56 +244,8 @@ class OllamaModel(BaseModel):
                 print(f"Error parsing response: {str(e)}")
                 # Fallback if the model doesn't return valid JSON
                 raw_response = response.get("message", {}).get("content", "") if isinstance(response, dict) else str(response)
-                return ModelResponse(raw_response=raw_response)
+                return ModelResponse(raw_response=raw_response, status=STATUS_ERROR)
                 
         except Exception as e:
             print(f"Error calling Ollama API: {str(e)}")
-            return ModelResponse()
-    
-    def _parse_number(self, value: Any) -> Optional[float]:
-        """Parse a numeric value, handling various formats."""
-        if value is None:
-            return None
-        if isinstance(value, (int, float)):
-            return float(value)
-        if isinstance(value, str):
-            try:
-                # Remove commas from numbers like "1,234.56"
-                cleaned = value.replace(',', '')
-                return float(cleaned)
-            except ValueError:
-                return None
-        return None
-    
-    def _parse_currency(self, value: Any) -> Optional[str]:
-        """Parse a currency code, handling various formats."""
-        if value is None:
-            return None
-        if isinstance(value, str):
-            # Currency symbols to codes
-            currency_map = {
-                "$": "USD",
-                "€": "EUR",
-                "£": "GBP",
-                "¥": "JPY",
-                "₹": "INR",
-                "dollars": "USD",
-                "euros": "EUR",
-                "pounds": "GBP",
-                "yen": "JPY",
-                "rupees": "INR",
-                "shekels": "ILS",
-            }
-            
-            # Clean the value
-            value = value.strip()
-            
-            # Check for symbol mapping
-            if value in currency_map:
-                return currency_map[value]
-            
-            # Check if it's already a 3-letter code
-            if len(value) == 3 and value.isalpha():
-                return value.upper()
-        
-        return None
\ No newline at end of file
+            return ModelResponse(status=STATUS_TIMEOUT if is_timeout_error(e) else STATUS_ERROR)
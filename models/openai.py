@@ -1,8 +1,10 @@
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Any, Tuple
 import json
 from openai import AsyncOpenAI
-from .base import BaseModel, ModelResponse
-from prompts.click_value import get_system_prompt, get_user_prompt
+from .base import BaseModel, ModelResponse, STATUS_ERROR, STATUS_TIMEOUT
+from utils.deadline import CallPolicy, Deadline, is_timeout_error
+from utils.profiling import stage
+from prompts.click_value import MAX_OUTPUT_TOKENS, RESPONSE_SCHEMA, get_system_prompt, get_user_prompt
 
 class OpenAIModel(BaseModel):
     """Interface for OpenAI models."""
@@ -11,95 +13,92 @@ class OpenAIModel(BaseModel):
         self, 
         api_key: str,
         model_name: str = "gpt-4o-mini", 
+        call_policy: Optional[CallPolicy] = None,
     ):
+        super().__init__(call_policy)
         self.model_name = model_name
-        # Initialize with higher timeout (10 minutes) to handle large HTML content
-        self.client = AsyncOpenAI(api_key=api_key, timeout=600.0)
+        # Timeouts and retries are handled per attempt by the call policy
+        self.client = AsyncOpenAI(api_key=api_key, max_retries=0)
     
     async def evaluate_click(
         self, 
         html: str, 
-        button_text: str
+        button_text: str,
+        deadline: Optional[Deadline] = None,
+        hint: Optional[str] = None,
+        ultra_compact: bool = True
     ) -> ModelResponse:
         """Determine the monetary value of a click using OpenAI model."""
-        system_prompt = get_system_prompt()
-        user_prompt = get_user_prompt(html, button_text)
+        with stage("build_prompt"):
+            system_prompt = get_system_prompt(ultra_compact)
+            user_prompt = get_user_prompt(html, button_text, hint)
+        request = self._build_request(system_prompt, user_prompt)
         
         try:
-            response = await self.client.chat.completions.create(
-                model=self.model_name,
-                response_format={"type": "json_object"},
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ]
+            response = await self.call_policy.run(
+                lambda timeout: self.client.chat.completions.create(**request, timeout=timeout),
+                deadline
             )
             
-            raw_response = response.choices[0].message.content
-            
-            try:
-                output = json.loads(raw_response)
-                
-                # Validate and parse fields
-                value = self._parse_number(output.get("value"))
-                currency = self._parse_currency(output.get("currency"))
-                
-                return ModelResponse(
-                    value=value,
-                    currency=currency,
-                    raw_response=raw_response
-                )
-            except (json.JSONDecodeError, KeyError):
-                return ModelResponse(raw_response=raw_response)
+            return self._parse_content(response.choices[0].message.content)
                 
         except Exception as e:
             print(f"Error calling OpenAI API: {str(e)}")
-            return ModelResponse()
+            return ModelResponse(status=STATUS_TIMEOUT if is_timeout_error(e) else STATUS_ERROR)
     
-    def _parse_number(self, value: Any) -> Optional[float]:
-        """Parse a numeric value, handling various formats."""
-        if value is None:
-            return None
-        if isinstance(value, (int, float)):
-            return float(value)
-        if isinstance(value, str):
-            try:
-                # Remove commas from numbers like "1,234.56"
-                cleaned = value.replace(',', '')
-                return float(cleaned)
-            except ValueError:
-                return None
-        return None
+    async def _complete_json(
+        self,
+        system_prompt: str,
+        user_prompt: str,
+        schema_name: str,
+        schema: Dict[str, Any],
+        max_tokens: int,
+        deadline: Optional[Deadline] = None
+    ) -> Tuple[Any, str]:
+        """Run a schema-constrained completion and return (parsed JSON, raw text)."""
+        request = self._build_request(system_prompt, user_prompt, schema_name, schema, max_tokens)
+        response = await self.call_policy.run(
+            lambda timeout: self.client.chat.completions.create(**request, timeout=timeout),
+            deadline
+        )
+        raw_response = response.choices[0].message.content
+        return json.loads(raw_response), raw_response
     
-    def _parse_currency(self, value: Any) -> Optional[str]:
-        """Parse a currency code, handling various formats."""
-        if value is None:
-            return None
-        if isinstance(value, str):
-            # Currency symbols to codes
-            currency_map = {
-                "$": "USD",
-                "€": "EUR",
-                "£": "GBP",
-                "¥": "JPY",
-                "₹": "INR",
-                "dollars": "USD",
-                "euros": "EUR",
-                "pounds": "GBP",
-                "yen": "JPY",
-                "rupees": "INR",
-                "shekels": "ILS",
-            }
-            
-            # Clean the value
-            value = value.strip()
+    def _build_request(
+        self,
+        system_prompt: str,
+        user_prompt: str,
+        schema_name: str = "click_value",
+        schema: Dict[str, Any] = RESPONSE_SCHEMA,
+        max_tokens: int = MAX_OUTPUT_TOKENS
+    ) -> Dict[str, Any]:
+        """Build the Chat Completions request body (shared with the batch backend)."""
+        return {
+            "model": self.model_name,
+            "response_format": {
+                "type": "json_schema",
+                "json_schema": {"name": schema_name, "strict": True, "schema": schema}
+            },
+            "max_completion_tokens": max_tokens,
+            "messages": [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_prompt}
+            ]
+        }
+    
+    def _parse_content(self, raw_response: Optional[str]) -> ModelResponse:
+        """Parse the text of a model reply into a ModelResponse."""
+        try:
+            output = json.loads(raw_response)
             
-            # Check for symbol mapping
-            if value in currency_map:
-                return currency_map[value]
+            # Validate and parse fields
+            value = self._parse_number(output.get("value"))
+            currency = self._parse_currency(output.get("currency"))
             
-            # Check if it's already a 3-letter code
-            if len(value) == 3 and value.isalpha():
-                return value.upper()
-        
-        return None 
\ No newline at end of file
+            return ModelResponse(
+                value=value,
+                currency=currency,
+                raw_response=raw_response
+            )
+        except (json.JSONDecodeError, KeyError, TypeError, AttributeError):
+            return ModelResponse(raw_response=raw_response, status=STATUS_ERROR)
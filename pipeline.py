@@ -0,0 +1,202 @@
+"""
+Click evaluation pipeline shared by the web UI and the queue workers.
+
+Importing this module loads the environment and initializes the configured models.
+"""
+import os
+import asyncio
+from dotenv import load_dotenv
+from typing import Dict, List, Any, Optional, Tuple
+import json
+
+from models import BaseModel, OllamaModel, OpenAIModel, AnthropicModel, ModelResponse
+from models.base import STATUS_NO_VALUE, STATUS_OK, STATUS_TIMEOUT
+from utils.deadline import Deadline
+from utils.metrics import METRICS
+from utils.profiling import sampled_request, stage
+from utils.html_parser import clean_html
+from utils.templates import TemplateStore, domain_from_url
+from utils.page_cache import PageCache
+from prompts.click_value import get_prompt_stats
+from utils.structured_data import extract_structured_prices, format_structured_hint, resolve_structured_price
+from bs4 import BeautifulSoup
+
+# Load environment variables
+load_dotenv()
+
+# Initialize models
+ollama_model = OllamaModel(model_name=os.getenv("OLLAMA_MODEL", "llama3.2"))
+
+# Initialize OpenAI and Anthropic models if API keys are provided
+openai_model = None
+anthropic_model = None
+
+if os.getenv("OPENAI_API_KEY"):
+    openai_model = OpenAIModel(
+        api_key=os.getenv("OPENAI_API_KEY"),
+        model_name=os.getenv("OPENAI_MODEL", "gpt-4o-mini")
+    )
+
+if os.getenv("ANTHROPIC_API_KEY"):
+    anthropic_model = AnthropicModel(
+        api_key=os.getenv("ANTHROPIC_API_KEY"),
+        model_name=os.getenv("ANTHROPIC_MODEL", "claude-3-opus-20240229")
+    )
+
+# Learned per-domain extraction templates (disable with TEMPLATES_ENABLED=0)
+template_store = TemplateStore() if os.getenv("TEMPLATES_ENABLED", "1") == "1" else None
+
+# Structured-data fast path: "answer" (answer directly when unambiguous, otherwise hint),
+# "hint" (only pass prices to the model as a hint) or "off"
+structured_data_mode = os.getenv("STRUCTURED_DATA_MODE", "answer")
+
+# Result cache with near-duplicate matching (disable with CACHE_ENABLED=0)
+page_cache = PageCache() if os.getenv("CACHE_ENABLED", "1") == "1" else None
+
+def warm_up_models() -> None:
+    """Preload the Ollama model so the first click doesn't pay the model-load time."""
+    if os.getenv("OLLAMA_WARMUP", "1") == "1":
+        asyncio.run(ollama_model.warm_up())
+
+def select_model(model_choice: str) -> Optional[BaseModel]:
+    """Return the model for the user's choice, or None if it isn't configured."""
+    if model_choice == "Ollama":
+        return ollama_model
+    if model_choice == "OpenAI":
+        return openai_model
+    if model_choice == "Anthropic":
+        return anthropic_model
+    return None
+
+@sampled_request
+async def process_click(
+    html: str, 
+    button_text: str,
+    model_choice: str,
+    ultra_compact: bool,
+    page_url: str = ""
+) -> Tuple[Dict[str, Any], str, str, Optional[str]]:
+    """Process click data and determine monetary value."""
+    
+    # Every stage of the request shares a single time budget
+    deadline = Deadline.from_env()
+    
+    # Raw page parse shared by the stages that need markup removed by clean_html
+    domain = domain_from_url(page_url) if template_store else None
+    page_soup = None
+    if domain or structured_data_mode != "off":
+        with stage("parse_page"):
+            page_soup = BeautifulSoup(html, 'html.parser')
+    
+    # Try a learned template for this domain before paying for a model call
+    if domain:
+        with stage("template_lookup"):
+            hit = template_store.lookup(domain, button_text, page_soup)
+        if hit:
+            result = ModelResponse(
+                value=hit["value"],
+                currency=hit["currency"],
+                raw_response=json.dumps(hit),
+                source="template"
+            )
+            return result.to_dict(), "", "Answered by learned template (no model call)", result.raw_response
+    
+    # Harvest JSON-LD / microdata / meta prices before cleaning strips them
+    structured_hint = None
+    if structured_data_mode != "off":
+        with stage("structured_data"):
+            candidates = extract_structured_prices(page_soup)
+            match = None
+            if structured_data_mode == "answer":
+                match = resolve_structured_price(candidates, page_soup, button_text)
+        if structured_data_mode == "answer":
+            if match:
+                result = ModelResponse(
+                    value=match["value"],
+                    currency=match["currency"],
+                    raw_response=json.dumps(match),
+                    source="structured_data"
+                )
+                return result.to_dict(), "", "Answered from structured data (no model call)", result.raw_response
+        structured_hint = format_structured_hint(candidates)
+    
+    # Clean HTML to reduce tokens
+    with stage("clean_html"):
+        cleaned_html, original_size, new_size = clean_html(html, button_text, ultra_compact)
+    
+    # Create size reduction message
+    reduction_percent = ((original_size - new_size) / original_size) * 100 if original_size > 0 else 0
+    size_info = f"Original: {original_size:,} chars | Cleaned: {new_size:,} chars | Reduced by: {reduction_percent:.1f}%"
+    size_info += f" | Prompt examples: ~{get_prompt_stats(ultra_compact)['saved_tokens']:,} tokens saved"
+    
+    # Select model based on user choice
+    model = select_model(model_choice)
+    if model is None:
+        return {"error": "Selected model is not available. Please check API keys or select Ollama."}, cleaned_html, size_info, None
+    
+    # Reuse the answer for this page or a near-duplicate with the same prices around the button
+    if page_cache:
+        with stage("cache_lookup"):
+            cached = page_cache.lookup(model_choice, button_text, cleaned_html)
+        if cached:
+            result = ModelResponse(**{**cached, "source": "cache"})
+            return result.to_dict(), cleaned_html, size_info, result.raw_response
+    
+    # Don't start a provider call once the budget is already spent (a cache hit is still fine)
+    if deadline.expired():
+        result = ModelResponse(status=STATUS_TIMEOUT)
+        return result.to_dict(), cleaned_html, size_info, result.raw_response
+    
+    # Process with the selected model using cleaned HTML
+    result = await model.evaluate_click(cleaned_html, button_text, deadline=deadline, hint=structured_hint, ultra_compact=ultra_compact)
+    
+    # Only cache real answers, never timeouts or errors
+    if page_cache and result.status in (STATUS_OK, STATUS_NO_VALUE):
+        page_cache.store(model_choice, button_text, cleaned_html, result.to_dict())
+    
+    # Learn a template when the model's value can be located in the page
+    if domain and result.value is not None:
+        with stage("template_learn"):
+            template_store.learn(domain, button_text, page_soup, result.value, result.currency)
+    
+    # Return the raw response as well
+    return result.to_dict(), cleaned_html, size_info, result.raw_response
+
+@sampled_request
+async def process_clicks(
+    html: str,
+    button_texts: List[str],
+    model_choice: str,
+    ultra_compact: bool
+) -> Tuple[List[Dict[str, Any]], str, str]:
+    """Determine the monetary values of several buttons on one page with a single cleaning pass and model call."""
+    
+    deadline = Deadline.from_env()
+    button_texts = [text.strip() for text in button_texts if text.strip()]
+    
+    with stage("clean_html"):
+        cleaned_html, original_size, new_size = clean_html(html, button_texts, ultra_compact)
+    reduction_percent = ((original_size - new_size) / original_size) * 100 if original_size > 0 else 0
+    size_info = f"Original: {original_size:,} chars | Cleaned: {new_size:,} chars | Reduced by: {reduction_percent:.1f}% | Buttons: {len(button_texts)}"
+    size_info += f" | Prompt examples: ~{get_prompt_stats(ultra_compact)['saved_tokens']:,} tokens saved"
+    
+    model = select_model(model_choice)
+    if model is None:
+        return [{"error": "Selected model is not available. Please check API keys or select Ollama."}], cleaned_html, size_info
+    if not button_texts:
+        return [], cleaned_html, size_info
+    
+    results = await model.evaluate_clicks(cleaned_html, button_texts, deadline=deadline, ultra_compact=ultra_compact)
+    return [
+        {"button_text": text, **result.to_dict()}
+        for text, result in zip(button_texts, results)
+    ], cleaned_html, size_info
+
+def metrics_snapshot() -> Dict[str, Any]:
+    """Metrics counters and events plus cache and template statistics."""
+    snapshot = METRICS.snapshot()
+    if page_cache:
+        snapshot["page_cache"] = page_cache.stats()
+    if template_store:
+        snapshot["templates"] = template_store.stats()
+    return snapshot
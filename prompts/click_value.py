@@ -1,9 +1,66 @@
-from typing import List
+from typing import Any, Dict, List, Optional, Tuple
+from functools import lru_cache
 from examples.click_examples import EXAMPLES
+from utils.html_parser import clean_html
 import json
 
-def get_system_prompt() -> str:
-    """Generate the system prompt for click value evaluation."""
+# Bump whenever the prompt text or the example preprocessing changes; cached prompts are keyed by it
+PROMPT_VERSION = "2"
+
+# Rough characters-per-token ratio used for reporting token savings
+CHARS_PER_TOKEN = 3.5
+
+# JSON schema of the answer, used to constrain generation on every provider
+RESPONSE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "value": {
+            "type": ["number", "null"],
+            "description": "Numeric monetary value associated with the clicked button, or null if uncertain"
+        },
+        "currency": {
+            "type": ["string", "null"],
+            "description": "3-letter currency code (USD, EUR, GBP, etc.), or null if uncertain"
+        }
+    },
+    "required": ["value", "currency"],
+    "additionalProperties": False
+}
+
+# The answer is a tiny JSON object; anything longer is a runaway generation
+MAX_OUTPUT_TOKENS = 64
+
+# Schema for evaluating several buttons of one page in a single call
+MULTI_RESPONSE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "results": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "button_text": {"type": "string", "description": "The button text exactly as given"},
+                    "value": RESPONSE_SCHEMA["properties"]["value"],
+                    "currency": RESPONSE_SCHEMA["properties"]["currency"]
+                },
+                "required": ["button_text", "value", "currency"],
+                "additionalProperties": False
+            }
+        }
+    },
+    "required": ["results"],
+    "additionalProperties": False
+}
+
+# Output budget per button in a multi-button answer (the button text is echoed back)
+MAX_OUTPUT_TOKENS_PER_BUTTON = 48
+
+def get_multi_max_tokens(button_count: int) -> int:
+    """Output token cap for a multi-button answer."""
+    return 16 + MAX_OUTPUT_TOKENS_PER_BUTTON * button_count
+
+def _render_system_prompt(example_htmls: Tuple[str, ...]) -> str:
+    """Render the system prompt around the given example HTML snippets."""
     
     system_prompt = """Your task is to analyze the HTML context and clicked button text to determine the monetary value of a click (For example - how much money the item costs).
 Focus on finding the value (price) most closely associated with the clicked button.
@@ -44,7 +101,7 @@ Here are examples of how to analyze different SIMPLE scenarios:
 """
 
     # Add examples
-    for i, example in enumerate(EXAMPLES):
+    for i, (example, example_html) in enumerate(zip(EXAMPLES, example_htmls)):
         # Create a simplified response that excludes isValueClick
         modified_response = {
             "value": example['response']['value'],
@@ -53,7 +110,7 @@ Here are examples of how to analyze different SIMPLE scenarios:
         
         system_prompt += f"""
 EXAMPLE {i+1}:
-HTML: {example['html']}
+HTML: {example_html}
 Button Text: {example['button_text']}
 Analysis: 
 - {'Value: ' + str(example['response']['value']) if example['response']['value'] is not None else 'Value is uncertain'}
@@ -64,13 +121,47 @@ OUTPUT: {json.dumps(modified_response)}
     
     return system_prompt
 
-def get_user_prompt(html: str, button_text: str) -> str:
+@lru_cache(maxsize=None)
+def _cleaned_example_htmls(version: str, ultra_compact: bool) -> Tuple[str, ...]:
+    """Run the example HTML through the same cleaning as live input, once per prompt version and mode."""
+    return tuple(clean_html(example['html'], example['button_text'], ultra_compact)[0] for example in EXAMPLES)
+
+@lru_cache(maxsize=None)
+def _system_prompt(version: str, ultra_compact: bool) -> str:
+    return _render_system_prompt(_cleaned_example_htmls(version, ultra_compact))
+
+def get_system_prompt(ultra_compact: bool = True) -> str:
+    """
+    Generate the system prompt for click value evaluation.
+    
+    The examples are cleaned with the same mode as the user's HTML, so they match
+    its format and don't carry the indentation of the source file.
+    """
+    return _system_prompt(PROMPT_VERSION, ultra_compact)
+
+@lru_cache(maxsize=None)
+def get_prompt_stats(ultra_compact: bool = True) -> Dict[str, Any]:
+    """Size of the system prompt compared with embedding the raw example HTML."""
+    raw_chars = len(_render_system_prompt(tuple(example['html'] for example in EXAMPLES)))
+    chars = len(get_system_prompt(ultra_compact))
+    return {
+        "prompt_version": PROMPT_VERSION,
+        "raw_chars": raw_chars,
+        "chars": chars,
+        "saved_chars": raw_chars - chars,
+        "saved_tokens": int((raw_chars - chars) / CHARS_PER_TOKEN),
+    }
+
+def get_user_prompt(html: str, button_text: str, hint: Optional[str] = None) -> str:
     """Generate the user prompt with the current case to analyze."""
     
+    # Prices found in the page's structured data (JSON-LD, microdata, meta tags)
+    hint_line = f"\nstructured_data_prices: {hint}\n" if hint else ""
+    
     return f"""html: {html}
 
 button_text: {button_text}
-
+{hint_line}
 Respond ONLY with a valid JSON object following the exact format specified in the system prompt.
 Focus on the value (price) closest to the button text element in the HTML structure.
 Make sure the "value" field is a numeric value or null, never a boolean or string.
@@ -78,6 +169,27 @@ Make sure the "currency" field is a 3-letter currency code or null.
 Make sure the value is a number that must exist in the HTML.
 """
 
-def get_prompt(html: str, button_text: str) -> str:
+def get_multi_user_prompt(html: str, button_texts: List[str], hint: Optional[str] = None) -> str:
+    """Generate the user prompt asking for the values of several buttons on the same page."""
+    
+    hint_line = f"\nstructured_data_prices: {hint}\n" if hint else ""
+    buttons = "\n".join(f"- {json.dumps(text)}" for text in button_texts)
+    
+    return f"""html: {html}
+
+button_texts:
+{buttons}
+{hint_line}
+Analyze each button text separately, exactly as you would analyze a single button.
+Respond ONLY with a JSON object {{"results": [...]}} containing one entry per button text, in the same order,
+each with "button_text" (copied exactly), "value" and "currency" following the format specified in the system prompt.
+Make sure every value is a number that must exist in the HTML, or null.
+"""
+
+def get_prompt(html: str, button_text: str, ultra_compact: bool = True) -> str:
     """Legacy function that combines system and user prompts for backward compatibility."""
-    return get_system_prompt() + "\n\nNow analyze this case:\n" + get_user_prompt(html, button_text)
\ No newline at end of file
+    return get_system_prompt(ultra_compact) + "\n\nNow analyze this case:\n" + get_user_prompt(html, button_text)
+
+# Build both prompt variants at import time so no request pays for cleaning the examples
+for _ultra_compact in (True, False):
+    get_system_prompt(_ultra_compact)
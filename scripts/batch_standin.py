@@ -0,0 +1,163 @@
+"""
+Local stand-in for the OpenAI Batch and Anthropic Message Batches endpoints.
+
+Point the SDKs at it to exercise the batch backend without real API calls:
+
+    python scripts/batch_standin.py --port 8765
+    OPENAI_BASE_URL=http://127.0.0.1:8765/v1 ANTHROPIC_BASE_URL=http://127.0.0.1:8765 python backfill.py ...
+
+Jobs complete immediately. Each request is answered with the first price found
+in its user prompt, so results are deterministic.
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict
+import argparse
+import email
+import json
+import os
+import re
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.html_parser import detect_currency, extract_prices
+
+FILES: Dict[str, bytes] = {}
+OPENAI_BATCHES: Dict[str, Dict[str, Any]] = {}
+ANTHROPIC_BATCHES: Dict[str, Dict[str, Any]] = {}
+
+
+def _answer(user_prompt: str) -> str:
+    """Fake model reply: the first price in the prompt's HTML."""
+    html = user_prompt.split("button_text:")[0]
+    html = re.sub(r"<[^>]+>", " ", html)
+    prices = extract_prices(html)
+    return json.dumps({
+        "value": prices[0] if prices else None,
+        "currency": detect_currency(html) if prices else None,
+    })
+
+
+def _user_prompt(messages: Any) -> str:
+    for message in messages:
+        if message.get("role") == "user":
+            content = message.get("content")
+            return content if isinstance(content, str) else json.dumps(content)
+    return ""
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    def _send(self, status: int, body: Any, content_type: str = "application/json") -> None:
+        data = body if isinstance(body, bytes) else json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _body(self) -> bytes:
+        return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+    def do_POST(self) -> None:
+        path = self.path.split("?")[0]
+        if path == "/v1/files":
+            # Multipart upload: keep the "file" part
+            message = email.message_from_bytes(
+                f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode("utf-8") + self._body()
+            )
+            file_id = f"file-{uuid.uuid4().hex[:12]}"
+            for part in message.get_payload():
+                if part.get_param("name", header="content-disposition") == "file":
+                    FILES[file_id] = part.get_payload(decode=True)
+            self._send(200, {"id": file_id, "object": "file", "bytes": len(FILES.get(file_id, b"")),
+                             "created_at": int(time.time()), "filename": "batch_input.jsonl",
+                             "purpose": "batch", "status": "processed"})
+        elif path == "/v1/batches":
+            request = json.loads(self._body())
+            batch_id = f"batch_{uuid.uuid4().hex[:12]}"
+            output_lines = []
+            for line in FILES[request["input_file_id"]].decode("utf-8").splitlines():
+                entry = json.loads(line)
+                content = _answer(_user_prompt(entry["body"]["messages"]))
+                output_lines.append(json.dumps({
+                    "id": f"resp_{uuid.uuid4().hex[:8]}",
+                    "custom_id": entry["custom_id"],
+                    "response": {"status_code": 200, "body": {
+                        "choices": [{"index": 0, "message": {"role": "assistant", "content": content}}]
+                    }},
+                    "error": None,
+                }))
+            output_file_id = f"file-{uuid.uuid4().hex[:12]}"
+            FILES[output_file_id] = "\n".join(output_lines).encode("utf-8")
+            OPENAI_BATCHES[batch_id] = {
+                "id": batch_id, "object": "batch", "endpoint": request["endpoint"],
+                "input_file_id": request["input_file_id"], "completion_window": request["completion_window"],
+                "status": "completed", "output_file_id": output_file_id, "error_file_id": None,
+                "created_at": int(time.time()),
+            }
+            self._send(200, OPENAI_BATCHES[batch_id])
+        elif path == "/v1/messages/batches":
+            request = json.loads(self._body())
+            batch_id = f"msgbatch_{uuid.uuid4().hex[:12]}"
+            results = []
+            for item in request["requests"]:
+                content = _answer(_user_prompt(item["params"]["messages"]))
+                tool_choice = item["params"].get("tool_choice") or {}
+                if tool_choice.get("type") == "tool":
+                    # Forced tool use: reply with the answer as tool input
+                    blocks = [{"type": "tool_use", "id": f"toolu_{uuid.uuid4().hex[:8]}",
+                               "name": tool_choice["name"], "input": json.loads(content)}]
+                    stop_reason = "tool_use"
+                else:
+                    blocks = [{"type": "text", "text": content}]
+                    stop_reason = "end_turn"
+                results.append(json.dumps({
+                    "custom_id": item["custom_id"],
+                    "result": {"type": "succeeded", "message": {
+                        "id": f"msg_{uuid.uuid4().hex[:8]}", "type": "message", "role": "assistant",
+                        "model": item["params"]["model"], "content": blocks,
+                        "stop_reason": stop_reason, "stop_sequence": None,
+                        "usage": {"input_tokens": 0, "output_tokens": 0},
+                    }},
+                }))
+            host = self.headers.get("Host")
+            ANTHROPIC_BATCHES[batch_id] = {
+                "meta": {
+                    "id": batch_id, "type": "message_batch", "processing_status": "ended",
+                    "request_counts": {"processing": 0, "succeeded": len(results), "errored": 0,
+                                       "canceled": 0, "expired": 0},
+                    "created_at": "2024-01-01T00:00:00Z", "expires_at": "2024-01-02T00:00:00Z",
+                    "ended_at": "2024-01-01T00:00:00Z", "archived_at": None, "cancel_initiated_at": None,
+                    "results_url": f"http://{host}/v1/messages/batches/{batch_id}/results",
+                },
+                "results": "\n".join(results).encode("utf-8"),
+            }
+            self._send(200, ANTHROPIC_BATCHES[batch_id]["meta"])
+        else:
+            self._send(404, {"error": {"message": f"Unknown endpoint {path}"}})
+
+    def do_GET(self) -> None:
+        parts = self.path.split("?")[0].strip("/").split("/")
+        if parts[:2] == ["v1", "batches"] and len(parts) == 3 and parts[2] in OPENAI_BATCHES:
+            self._send(200, OPENAI_BATCHES[parts[2]])
+        elif parts[:2] == ["v1", "files"] and len(parts) == 4 and parts[3] == "content" and parts[2] in FILES:
+            self._send(200, FILES[parts[2]], "application/octet-stream")
+        elif parts[:3] == ["v1", "messages", "batches"] and len(parts) >= 4 and parts[3] in ANTHROPIC_BATCHES:
+            batch = ANTHROPIC_BATCHES[parts[3]]
+            if len(parts) == 5 and parts[4] == "results":
+                self._send(200, batch["results"], "application/binary")
+            else:
+                self._send(200, batch["meta"])
+        else:
+            self._send(404, {"error": {"message": f"Unknown endpoint {self.path}"}})
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local stand-in for provider batch endpoints")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+    print(f"Batch stand-in listening on http://{args.host}:{args.port}")
+    ThreadingHTTPServer((args.host, args.port), StandInHandler).serve_forever()
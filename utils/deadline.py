@@ -0,0 +1,183 @@
+from typing import Awaitable, Callable, List, Optional, TypeVar
+import asyncio
+import os
+import random
+import time
+
+from utils.profiling import stage
+
+T = TypeVar("T")
+
+# HTTP status codes worth retrying (rate limits, overload and transient upstream failures)
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504, 529}
+
+
+class DeadlineExceeded(TimeoutError):
+    """Raised when a request runs out of its time budget."""
+    pass
+
+
+class Deadline:
+    """Absolute time budget shared by every stage of a single request."""
+
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        self.expires_at = time.monotonic() + seconds
+
+    @classmethod
+    def from_env(cls) -> "Deadline":
+        """Create a deadline using the REQUEST_DEADLINE environment variable."""
+        return cls(float(os.getenv("REQUEST_DEADLINE", "45")))
+
+    def remaining(self) -> float:
+        """Seconds left before the deadline (never negative)."""
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        """Whether the budget has been used up."""
+        return self.remaining() <= 0.0
+
+    def check(self, step: str = "request") -> None:
+        """Raise DeadlineExceeded if the budget is gone before `step` starts."""
+        if self.expired():
+            raise DeadlineExceeded(f"Deadline of {self.seconds:.1f}s exceeded before {step}")
+
+
+class LatencyTracker:
+    """Rolling window of observed call latencies."""
+
+    def __init__(self, window: int = 200):
+        self.window = window
+        self.samples: List[float] = []
+
+    def record(self, seconds: float) -> None:
+        """Add a latency sample, dropping the oldest one when the window is full."""
+        self.samples.append(seconds)
+        if len(self.samples) > self.window:
+            del self.samples[0]
+
+    def percentile(self, p: float) -> Optional[float]:
+        """Return the p-th percentile (0-1) of the window, or None when empty."""
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        index = min(len(ordered) - 1, int(round(p * (len(ordered) - 1))))
+        return ordered[index]
+
+
+def is_timeout_error(error: BaseException) -> bool:
+    """Check whether an exception represents a timeout (asyncio, SDK or HTTP client)."""
+    return isinstance(error, TimeoutError) or "Timeout" in type(error).__name__
+
+
+def is_retryable_error(error: BaseException) -> bool:
+    """Check whether an exception is transient and the call may be retried."""
+    if isinstance(error, DeadlineExceeded):
+        return False
+    if is_timeout_error(error) or isinstance(error, ConnectionError):
+        return True
+    if "Connection" in type(error).__name__:
+        return True
+    status_code = getattr(error, "status_code", None)
+    return status_code in RETRYABLE_STATUS_CODES
+
+
+class CallPolicy:
+    """
+    Timeout and retry policy for provider calls.
+
+    Per-attempt timeouts adapt to the observed latency percentile and are always
+    capped by the time left on the request deadline. Timed-out attempts count as
+    samples of at least their timeout, and a retry after a timeout gets a longer
+    one, so the adaptive timeout can grow back after a run of fast calls.
+    Retries use full-jitter exponential backoff and only happen while enough
+    budget remains for another attempt.
+    """
+
+    def __init__(
+        self,
+        default_timeout: Optional[float] = None,
+        max_retries: Optional[int] = None,
+        min_timeout: float = 2.0,
+        default_floor: float = 0.25,
+        max_timeout: float = 120.0,
+        percentile: float = 0.99,
+        multiplier: float = 2.0,
+        min_samples: int = 20,
+        backoff_base: float = 0.25,
+        backoff_cap: float = 4.0,
+    ):
+        self.default_timeout = default_timeout if default_timeout is not None else float(os.getenv("PROVIDER_TIMEOUT", "30"))
+        self.max_retries = max_retries if max_retries is not None else int(os.getenv("PROVIDER_MAX_RETRIES", "2"))
+        # Fast calls alone never pull the timeout below this fraction of the default
+        self.min_timeout = max(min_timeout, self.default_timeout * default_floor)
+        self.max_timeout = max_timeout
+        self.percentile = percentile
+        self.multiplier = multiplier
+        self.min_samples = min_samples
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.latency = LatencyTracker()
+
+    def attempt_timeout(self, deadline: Optional[Deadline] = None, at_least: float = 0.0) -> float:
+        """Timeout for the next attempt, derived from latency history and the deadline."""
+        timeout = self.default_timeout
+        if len(self.latency.samples) >= self.min_samples:
+            observed = self.latency.percentile(self.percentile)
+            timeout = min(self.max_timeout, max(self.min_timeout, observed * self.multiplier))
+        timeout = min(self.max_timeout, max(timeout, at_least))
+        if deadline is not None:
+            timeout = min(timeout, deadline.remaining())
+        return timeout
+
+    async def run(
+        self,
+        call: Callable[[float], Awaitable[T]],
+        deadline: Optional[Deadline] = None,
+    ) -> T:
+        """Run `call(timeout)` under the policy, timed as the "provider_call" stage."""
+        with stage("provider_call"):
+            return await self._run(call, deadline)
+
+    async def _run(
+        self,
+        call: Callable[[float], Awaitable[T]],
+        deadline: Optional[Deadline] = None,
+    ) -> T:
+        """
+        Run `call(timeout)` with adaptive timeouts and budgeted retries.
+
+        Args:
+            call: Coroutine factory receiving the per-attempt timeout in seconds
+            deadline: Optional request deadline that bounds every attempt
+
+        Returns:
+            Result of the first successful attempt
+        """
+        attempt = 0
+        at_least = 0.0
+        while True:
+            if deadline is not None:
+                deadline.check("provider call")
+            timeout = self.attempt_timeout(deadline, at_least)
+            started = time.monotonic()
+            try:
+                result = await asyncio.wait_for(call(timeout), timeout)
+                self.latency.record(time.monotonic() - started)
+                return result
+            except Exception as e:
+                if is_timeout_error(e):
+                    # The call took at least this long; without the sample the timeout could never grow again
+                    self.latency.record(max(time.monotonic() - started, timeout))
+                    at_least = timeout * self.multiplier
+                if attempt >= self.max_retries or not is_retryable_error(e):
+                    raise
+
+                backoff = random.uniform(0, min(self.backoff_cap, self.backoff_base * (2 ** attempt)))
+                if deadline is not None and deadline.remaining() < backoff + self.min_timeout:
+                    # Not enough budget left for a meaningful retry
+                    raise
+
+                print(f"Retrying provider call after error: {str(e)} (attempt {attempt + 1}/{self.max_retries})")
+                await asyncio.sleep(backoff)
+                attempt += 1
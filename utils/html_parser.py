@@ -1,16 +1,81 @@
-from typing import List, Dict, Any, Optional, Tuple
+from typing import List, Dict, Any, Optional, Tuple, Union
 from bs4 import BeautifulSoup, Comment, Doctype
+import os
 import re
 
-def clean_html(full_html: str, button_text: str, ultra_compact: bool = False) -> Tuple[str, int, int]:
+# Inline styles that hide an element
+HIDDEN_STYLE_PATTERN = re.compile(r'display\s*:\s*none|visibility\s*:\s*hidden', re.IGNORECASE)
+
+def _is_hidden(tag: Any) -> bool:
+    """Whether an element would not be rendered (or is hidden from the reader)."""
+    if tag.name == 'template' or tag.has_attr('hidden'):
+        return True
+    if tag.name == 'input' and str(tag.get('type', '')).lower() == 'hidden':
+        return True
+    if str(tag.get('aria-hidden', '')).lower() == 'true':
+        return True
+    style = tag.get('style')
+    return bool(style and HIDDEN_STYLE_PATTERN.search(style))
+
+
+def prune_hidden(
+    soup: BeautifulSoup,
+    button_text: Union[str, List[str]],
+    extra_selectors: Optional[List[str]] = None
+) -> int:
+    """
+    Remove elements that would not be visible on the page.
+    
+    Drops `hidden`, `aria-hidden="true"`, inline `display:none`/`visibility:hidden`,
+    `template` and hidden inputs, plus anything matching `extra_selectors`
+    (defaults to the comma-separated HIDDEN_SELECTORS environment variable).
+    The clicked button(s) and their ancestors are never removed.
+    
+    Returns:
+        Number of elements removed
+    """
+    if extra_selectors is None:
+        extra_selectors = [s.strip() for s in os.getenv("HIDDEN_SELECTORS", "").split(',') if s.strip()]
+    
+    protected = set()
+    button_texts = [button_text] if isinstance(button_text, str) else button_text
+    for text in button_texts:
+        for button in find_buttons(soup, text):
+            protected.add(id(button))
+            protected.update(id(parent) for parent in button.parents)
+    
+    to_remove = [tag for tag in soup.find_all(True) if _is_hidden(tag)]
+    for selector in extra_selectors:
+        try:
+            to_remove.extend(soup.select(selector))
+        except Exception as e:
+            print(f"Invalid hidden selector {selector!r}: {str(e)}")
+    
+    removed = 0
+    for tag in to_remove:
+        # Skip protected elements and those already removed with an ancestor
+        if id(tag) in protected or tag.decomposed:
+            continue
+        tag.decompose()
+        removed += 1
+    return removed
+
+
+def clean_html(
+    full_html: str,
+    button_text: Union[str, List[str]],
+    ultra_compact: bool = False,
+    prune_hidden_elements: bool = True
+) -> Tuple[str, int, int]:
     """
     Clean HTML to reduce tokens by removing unnecessary elements and focusing on
     button-relevant content.
     
     Args:
         full_html: Complete HTML content
-        button_text: Text of the clicked button
+        button_text: Text of the clicked button (or list of texts when evaluating several buttons)
         ultra_compact: If True, produces single-line minified HTML with no formatting
+        prune_hidden_elements: If True, drops elements that would not be visible (see prune_hidden)
         
     Returns:
         Tuple of (cleaned_html, original_size, new_size)
@@ -22,6 +87,10 @@ def clean_html(full_html: str, button_text: str, ultra_compact: bool = False) ->
         # Parse HTML
         soup = BeautifulSoup(full_html, 'html.parser')
         
+        # Drop non-rendered content while class/id/style are still available for matching
+        if prune_hidden_elements:
+            prune_hidden(soup, button_text)
+        
         # First pass of aggressive removal (elements typically not relevant for price extraction)
         for element in soup.find_all(['script', 'style', 'meta', 'svg', 'link', 'iframe', 'noscript', 'video', 'audio']):
             element.decompose()
@@ -90,4 +159,104 @@ def clean_html(full_html: str, button_text: str, ultra_compact: bool = False) ->
         return cleaned_html, original_size, new_size
     except Exception as e:
         print(f"Error cleaning HTML: {str(e)}")
-        return full_html, len(full_html), len(full_html)
\ No newline at end of file
+        return full_html, len(full_html), len(full_html)
+
+# Numbers that look like prices: "1,234.56", "1.234,56", "29.99", "125"
+PRICE_NUMBER_PATTERN = re.compile(r'\d{1,3}(?:[.,\s]\d{3})+(?:[.,]\d{1,2})?|\d+(?:[.,]\d{1,2})?')
+
+# Currency symbols and words that may appear next to a price
+CURRENCY_SYMBOLS = {
+    "$": "USD",
+    "€": "EUR",
+    "£": "GBP",
+    "¥": "JPY",
+    "₹": "INR",
+    "₪": "ILS",
+}
+
+BUTTON_TAGS = ['button', 'a', 'input']
+
+
+def _normalize_text(text: str) -> str:
+    """Collapse whitespace and lowercase text for comparisons."""
+    return ' '.join(text.split()).lower()
+
+
+def _parse_price_number(raw: str) -> Optional[float]:
+    """Convert a matched price string to a float, detecting the decimal separator."""
+    raw = re.sub(r'\s', '', raw)
+    if ',' in raw and '.' in raw:
+        # The right-most separator is the decimal one
+        if raw.rfind(',') > raw.rfind('.'):
+            raw = raw.replace('.', '').replace(',', '.')
+        else:
+            raw = raw.replace(',', '')
+    elif ',' in raw:
+        # "29,99" is a decimal comma, "1,234" is a thousands separator
+        if re.search(r',\d{1,2}$', raw):
+            raw = raw.replace(',', '.')
+        else:
+            raw = raw.replace(',', '')
+    elif raw.count('.') > 1 or re.search(r'\.\d{3}$', raw):
+        raw = raw.replace('.', '')
+    try:
+        return float(raw)
+    except ValueError:
+        return None
+
+
+def extract_prices(text: str) -> List[float]:
+    """Extract all price-like numbers from a piece of text, in order of appearance."""
+    prices = []
+    for match in PRICE_NUMBER_PATTERN.finditer(text):
+        value = _parse_price_number(match.group(0))
+        if value is not None:
+            prices.append(value)
+    return prices
+
+
+def extract_currency_prices(text: str) -> List[float]:
+    """Extract only numbers written next to a currency symbol or code (e.g. "$149.99", "50 ILS")."""
+    symbols = ''.join(re.escape(symbol) for symbol in CURRENCY_SYMBOLS)
+    codes = r'(?:USD|EUR|GBP|JPY|INR|ILS|CAD|AUD|CHF)'
+    number = PRICE_NUMBER_PATTERN.pattern
+    pattern = rf'(?:[{symbols}]|\b{codes})\s?({number})|({number})\s?(?:[{symbols}]|{codes}\b)'
+    prices = []
+    for match in re.finditer(pattern, text):
+        value = _parse_price_number(match.group(1) or match.group(2))
+        if value is not None:
+            prices.append(value)
+    return prices
+
+
+def detect_currency(text: str) -> Optional[str]:
+    """Detect a currency from symbols or 3-letter codes appearing in text."""
+    for symbol, code in CURRENCY_SYMBOLS.items():
+        if symbol in text:
+            return code
+    match = re.search(r'\b(USD|EUR|GBP|JPY|INR|ILS|CAD|AUD|CHF)\b', text)
+    return match.group(1) if match else None
+
+
+def find_buttons(soup: BeautifulSoup, button_text: str) -> List[Any]:
+    """
+    Find the elements matching the clicked button text.
+    
+    Exact (whitespace and case insensitive) matches on button-like elements are
+    preferred; partial matches are only returned when there is no exact match.
+    """
+    target = _normalize_text(button_text)
+    if not target:
+        return []
+    
+    # One pass, so an element that is both (e.g. <a role="button">) is only counted once
+    candidates = soup.find_all(lambda tag: tag.name in BUTTON_TAGS or tag.get('role') == 'button')
+    exact, partial = [], []
+    for tag in candidates:
+        text = _normalize_text(tag.get_text(' ') or tag.get('value', '') or '')
+        if text == target:
+            exact.append(tag)
+        elif target in text:
+            partial.append(tag)
+    
+    return exact or partial
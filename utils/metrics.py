@@ -0,0 +1,33 @@
+from collections import deque
+from typing import Any, Dict
+import threading
+import time
+
+
+class Metrics:
+    """In-process counters and a short log of notable events."""
+
+    def __init__(self, max_events: int = 200):
+        self._lock = threading.Lock()
+        self.counters: Dict[str, int] = {}
+        self.events = deque(maxlen=max_events)
+
+    def increment(self, name: str, amount: int = 1) -> None:
+        """Increase a counter."""
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def record_event(self, name: str, **fields: Any) -> None:
+        """Count an event and keep its details in the recent-events log."""
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + 1
+            self.events.append({"event": name, "time": time.time(), **fields})
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Return a copy of the counters and recent events."""
+        with self._lock:
+            return {"counters": dict(self.counters), "events": list(self.events)}
+
+
+# Process-wide metrics registry
+METRICS = Metrics()
@@ -0,0 +1,168 @@
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+import hashlib
+import os
+import re
+import threading
+
+from bs4 import BeautifulSoup
+
+from utils.html_parser import extract_currency_prices, extract_prices, find_buttons
+
+# Ancestor levels above the button that make up the "neighbourhood" we compare
+REGION_LEVELS_UP = 3
+SHINGLE_SIZE = 3
+SIMHASH_BITS = 64
+
+
+def _hash64(text: str) -> int:
+    return int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+def simhash(tokens: List[str]) -> int:
+    """64-bit SimHash over token shingles."""
+    if len(tokens) < SHINGLE_SIZE:
+        shingles = [" ".join(tokens)]
+    else:
+        shingles = [" ".join(tokens[i:i + SHINGLE_SIZE]) for i in range(len(tokens) - SHINGLE_SIZE + 1)]
+
+    weights = [0] * SIMHASH_BITS
+    for shingle in shingles:
+        h = _hash64(shingle)
+        for bit in range(SIMHASH_BITS):
+            weights[bit] += 1 if h >> bit & 1 else -1
+
+    fingerprint = 0
+    for bit, weight in enumerate(weights):
+        if weight > 0:
+            fingerprint |= 1 << bit
+    return fingerprint
+
+
+def similarity(a: int, b: int) -> float:
+    """Fraction of matching SimHash bits."""
+    return 1.0 - bin(a ^ b).count("1") / SIMHASH_BITS
+
+
+def button_region(cleaned_html: str, button_text: str) -> Tuple[List[str], Tuple[float, ...], Tuple[float, ...]]:
+    """
+    Describe the page around the clicked button.
+
+    Returns:
+        Tuple of (structure and text tokens of the region, price candidates in it,
+        currency-marked prices anywhere on the page)
+    """
+    soup = BeautifulSoup(cleaned_html, "html.parser")
+    region = soup
+    buttons = find_buttons(soup, button_text)
+    if len(buttons) == 1:
+        region = buttons[0]
+        for _ in range(REGION_LEVELS_UP):
+            if region.parent is None or region.parent.name == "[document]":
+                break
+            region = region.parent
+
+    tokens = []
+    for tag in [region] + region.find_all(True):
+        if tag.name != "[document]":
+            tokens.append(f"<{tag.name}>")
+    text = region.get_text(" ")
+    tokens.extend(re.findall(r"\w+", text.lower()))
+    # Without currency-marked prices fall back to every number, so a changed bare price never hits
+    prices = extract_currency_prices(text) or extract_prices(text)
+    page_prices = extract_currency_prices(soup.get_text(" "))
+    return tokens, tuple(prices), tuple(page_prices)
+
+
+class PageCache:
+    """
+    Result cache keyed by exact cleaned HTML, with a near-duplicate fallback.
+
+    Near-duplicates are pages whose button neighbourhood has a SimHash similarity
+    at or above the threshold. They only reuse a result when the neighbourhood has
+    price candidates, they are identical to the cached page's, and the cached value
+    appears among the page's currency-marked prices, so changed prices never hit.
+    """
+
+    def __init__(self, max_entries: Optional[int] = None, threshold: Optional[float] = None):
+        self.max_entries = max_entries or int(os.getenv("CACHE_MAX_ENTRIES", "1000"))
+        self.threshold = threshold if threshold is not None else float(os.getenv("CACHE_SIMILARITY", "0.9"))
+        self._lock = threading.Lock()
+        # (scope, exact key) -> entry, in LRU order
+        self._entries: "OrderedDict[Tuple[str, str], Dict[str, Any]]" = OrderedDict()
+        # Fingerprints computed by a missed lookup, reused by the store that follows it
+        self._pending: "OrderedDict[Tuple[str, str], Tuple[int, Tuple[float, ...]]]" = OrderedDict()
+        self.hits = {"exact": 0, "near": 0}
+        self.misses = 0
+
+    @staticmethod
+    def _scope(model_name: str, button_text: str) -> str:
+        return f"{model_name}|{' '.join(button_text.split()).lower()}"
+
+    def lookup(self, model_name: str, button_text: str, cleaned_html: str) -> Optional[Dict[str, Any]]:
+        """Return a cached result dict for this page, or None."""
+        scope = self._scope(model_name, button_text)
+        exact_key = hashlib.sha256(cleaned_html.encode("utf-8")).hexdigest()
+
+        with self._lock:
+            entry = self._entries.get((scope, exact_key))
+            if entry is not None:
+                self._entries.move_to_end((scope, exact_key))
+                self.hits["exact"] += 1
+                return entry["result"]
+
+        tokens, prices, page_prices = button_region(cleaned_html, button_text)
+        fingerprint = simhash(tokens)
+
+        with self._lock:
+            self._pending[(scope, exact_key)] = (fingerprint, prices)
+            while len(self._pending) > 64:
+                self._pending.popitem(last=False)
+
+            # Without prices near the button, similar pages could differ in a price further away
+            if not prices:
+                self.misses += 1
+                return None
+
+            best_key, best_similarity = None, self.threshold
+            for key, entry in self._entries.items():
+                if key[0] != scope or entry["prices"] != prices:
+                    continue
+                # The reused value must be a price actually shown on this page
+                if entry["result"].get("value") not in page_prices:
+                    continue
+                score = similarity(fingerprint, entry["fingerprint"])
+                if score >= best_similarity:
+                    best_key, best_similarity = key, score
+            if best_key is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(best_key)
+            self.hits["near"] += 1
+            return self._entries[best_key]["result"]
+
+    def store(self, model_name: str, button_text: str, cleaned_html: str, result: Dict[str, Any]) -> None:
+        """Cache a result for this page."""
+        scope = self._scope(model_name, button_text)
+        exact_key = hashlib.sha256(cleaned_html.encode("utf-8")).hexdigest()
+
+        with self._lock:
+            pending = self._pending.pop((scope, exact_key), None)
+        if pending is None:
+            tokens, prices, _ = button_region(cleaned_html, button_text)
+            pending = (simhash(tokens), prices)
+
+        with self._lock:
+            self._entries[(scope, exact_key)] = {
+                "fingerprint": pending[0],
+                "prices": pending[1],
+                "result": result,
+            }
+            self._entries.move_to_end((scope, exact_key))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit and miss counts."""
+        with self._lock:
+            return {"entries": len(self._entries), "hits": dict(self.hits), "misses": self.misses}
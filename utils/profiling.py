@@ -0,0 +1,236 @@
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from functools import wraps
+from typing import Any, Callable, Dict, Optional
+import itertools
+import json
+import os
+import signal
+import sys
+import threading
+import time
+import tracemalloc
+
+from utils.metrics import METRICS
+
+# Where captured profiles and sampled stage breakdowns are written
+PROFILE_DIR = os.getenv("PROFILE_DIR", ".cache/profiles")
+
+# Record a stage breakdown for 1 in N requests (0 disables sampling)
+STAGE_SAMPLE_RATE = int(os.getenv("STAGE_SAMPLE_RATE", "0"))
+
+_NOOP = nullcontext()
+_current_recorder: ContextVar[Optional["StageRecorder"]] = ContextVar("stage_recorder", default=None)
+_request_counter = itertools.count()
+_capture_lock = threading.Lock()
+
+
+class StageRecorder:
+    """Accumulates wall-clock time per stage for one sampled request."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.started = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + time.perf_counter() - started
+
+    def finish(self) -> Dict[str, Any]:
+        """Return the breakdown, including time not covered by any stage."""
+        total = time.perf_counter() - self.started
+        return {
+            "request": self.name,
+            "time": time.time(),
+            "total_ms": round(total * 1000, 2),
+            "stages_ms": {name: round(seconds * 1000, 2) for name, seconds in self.stages.items()},
+            "other_ms": round((total - sum(self.stages.values())) * 1000, 2),
+        }
+
+
+def stage(name: str):
+    """
+    Time a stage of the current request if it is being sampled.
+
+    Costs a context variable lookup when sampling is off.
+    """
+    recorder = _current_recorder.get()
+    if recorder is None:
+        return _NOOP
+    return recorder.stage(name)
+
+
+def _write_line(filename: str, record: Dict[str, Any]) -> None:
+    try:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        with open(os.path.join(PROFILE_DIR, filename), "a", encoding="utf-8") as f:
+            f.write(json.dumps(record) + "\n")
+    except OSError as e:
+        print(f"Error writing profile data: {str(e)}")
+
+
+def sampled_request(func: Callable) -> Callable:
+    """Decorate an async request handler so 1 in STAGE_SAMPLE_RATE calls records a stage breakdown."""
+
+    @wraps(func)
+    async def wrapper(*args, **kwargs):
+        if STAGE_SAMPLE_RATE <= 0 or next(_request_counter) % STAGE_SAMPLE_RATE:
+            return await func(*args, **kwargs)
+
+        recorder = StageRecorder(func.__name__)
+        token = _current_recorder.set(recorder)
+        try:
+            return await func(*args, **kwargs)
+        finally:
+            _current_recorder.reset(token)
+            breakdown = recorder.finish()
+            METRICS.record_event("stage_breakdown", **breakdown)
+            _write_line("stages.jsonl", breakdown)
+
+    return wrapper
+
+
+# Leaf frames of threads blocked in a wait; used to skip idle threads where
+# per-thread CPU clocks aren't available
+IDLE_FRAMES = {
+    ("threading.py", "wait"),
+    ("threading.py", "_wait_for_tstate_lock"),
+    ("queue.py", "get"),
+    ("selectors.py", "select"),
+    ("socket.py", "accept"),
+    ("socketserver.py", "serve_forever"),
+}
+
+
+def _thread_cpu_time(thread_id: int) -> Optional[float]:
+    """CPU seconds consumed by a thread, or None where per-thread clocks aren't supported."""
+    try:
+        return time.clock_gettime(time.pthread_getcpuclockid(thread_id))
+    except (AttributeError, OSError, OverflowError):
+        return None
+
+
+def _is_idle_frame(frame) -> bool:
+    code = frame.f_code
+    return (os.path.basename(code.co_filename), code.co_name) in IDLE_FRAMES
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}"
+
+
+def _capture(duration: float, interval: float) -> None:
+    """
+    Sample the stacks of threads that are using CPU and trace allocations for
+    `duration` seconds, then write the results.
+
+    A thread is only sampled when its CPU clock advanced since the previous sample
+    (falling back to skipping threads parked in a known wait), so idle pool threads
+    don't bury the code that actually burns CPU.
+    """
+    stamp = time.strftime("%Y%m%d-%H%M%S")
+    own_thread = threading.get_ident()
+    stacks: Counter = Counter()
+    functions: Counter = Counter()
+    cpu_times: Dict[int, Optional[float]] = {}
+    idle_samples = 0
+
+    started_tracing = not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start(25)
+
+    try:
+        end = time.monotonic() + duration
+        samples = 0
+        while time.monotonic() < end:
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_thread:
+                    continue
+                cpu_time = _thread_cpu_time(thread_id)
+                if cpu_time is not None:
+                    previous = cpu_times.get(thread_id)
+                    cpu_times[thread_id] = cpu_time
+                    busy = previous is not None and cpu_time > previous
+                else:
+                    busy = not _is_idle_frame(frame)
+                if not busy:
+                    idle_samples += 1
+                    continue
+                labels = []
+                while frame is not None:
+                    labels.append(_frame_label(frame))
+                    frame = frame.f_back
+                if labels:
+                    stacks[";".join(reversed(labels))] += 1
+                    functions[labels[0].rsplit(":", 1)[0]] += 1
+            samples += 1
+            time.sleep(interval)
+
+        snapshot = tracemalloc.take_snapshot()
+    finally:
+        if started_tracing:
+            tracemalloc.stop()
+
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+
+    # Collapsed stacks, loadable by flamegraph tools (speedscope, flamegraph.pl)
+    with open(os.path.join(PROFILE_DIR, f"cpu-{stamp}.folded"), "w", encoding="utf-8") as f:
+        for stack, count in stacks.most_common():
+            f.write(f"{stack} {count}\n")
+
+    with open(os.path.join(PROFILE_DIR, f"cpu-{stamp}.txt"), "w", encoding="utf-8") as f:
+        f.write(f"{samples} samples over {duration:.1f}s (top of stack, threads using CPU; {idle_samples} idle thread samples skipped)\n")
+        for function, count in functions.most_common(50):
+            f.write(f"{count:8d}  {function}\n")
+
+    snapshot.dump(os.path.join(PROFILE_DIR, f"mem-{stamp}.tracemalloc"))
+    with open(os.path.join(PROFILE_DIR, f"mem-{stamp}.txt"), "w", encoding="utf-8") as f:
+        for statistic in snapshot.statistics("lineno")[:50]:
+            f.write(f"{statistic}\n")
+
+    METRICS.record_event("profile_captured", path=PROFILE_DIR, stamp=stamp, samples=samples)
+    print(f"Profile written to {PROFILE_DIR} ({stamp})")
+
+
+def capture_profile(duration: Optional[float] = None, interval: float = 0.005) -> bool:
+    """
+    Capture a time-boxed CPU sample profile and tracemalloc snapshot in a background thread.
+
+    Returns:
+        False if a capture is already running
+    """
+    if not _capture_lock.acquire(blocking=False):
+        print("Profile capture already in progress")
+        return False
+    duration = duration if duration is not None else float(os.getenv("PROFILE_DURATION", "30"))
+
+    def run():
+        try:
+            _capture(duration, interval)
+        except Exception as e:
+            print(f"Error capturing profile: {str(e)}")
+        finally:
+            _capture_lock.release()
+
+    threading.Thread(target=run, name="profile-capture", daemon=True).start()
+    return True
+
+
+def install_profiling_triggers() -> None:
+    """
+    Enable the opt-in profiling triggers.
+
+    PROFILE_SIGNAL=1 captures a profile on SIGUSR1 (`kill -USR1 <pid>`);
+    PROFILE_ON_START=1 captures one right away.
+    """
+    if os.getenv("PROFILE_SIGNAL", "0") == "1" and hasattr(signal, "SIGUSR1"):
+        signal.signal(signal.SIGUSR1, lambda signum, frame: capture_profile())
+    if os.getenv("PROFILE_ON_START", "0") == "1":
+        capture_profile()
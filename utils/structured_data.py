@@ -0,0 +1,169 @@
+from typing import Any, Dict, List, Optional
+import json
+import math
+
+from bs4 import BeautifulSoup, Tag
+
+from utils.html_parser import extract_currency_prices, extract_prices, find_buttons
+
+# Meta tags carrying product prices (Open Graph and Facebook product markup)
+PRICE_META_TAGS = {
+    "og:price:amount": "og:price:currency",
+    "product:price:amount": "product:price:currency",
+}
+
+# How far up from the button the structured price must be visible
+MAX_LEVELS_UP = 6
+
+
+def _to_price(value: Any) -> Optional[float]:
+    """Parse a structured-data price, which is usually a plain number or numeric string."""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value) if math.isfinite(value) else None
+    if isinstance(value, str):
+        # schema.org and meta prices always use "." as the decimal point ("12.500" is 12.5),
+        # so only fall back to the visible-text heuristic for formatted text
+        try:
+            price = float(value.strip())
+            return price if math.isfinite(price) else None
+        except ValueError:
+            pass
+        prices = extract_prices(value)
+        return prices[0] if prices else None
+    return None
+
+
+def _to_currency(value: Any) -> Optional[str]:
+    """Accept only 3-letter currency codes."""
+    if isinstance(value, str) and len(value.strip()) == 3 and value.strip().isalpha():
+        return value.strip().upper()
+    return None
+
+
+def _walk_json_ld(node: Any, candidates: List[Dict[str, Any]]) -> None:
+    """Collect Offer prices from any nesting of JSON-LD objects and lists."""
+    if isinstance(node, list):
+        for item in node:
+            _walk_json_ld(item, candidates)
+        return
+    if not isinstance(node, dict):
+        return
+
+    if "price" in node or "lowPrice" in node:
+        value = _to_price(node.get("price", node.get("lowPrice")))
+        if value is not None:
+            candidates.append({
+                "value": value,
+                "currency": _to_currency(node.get("priceCurrency")),
+                "source": "json-ld",
+            })
+
+    for key, child in node.items():
+        if isinstance(child, (dict, list)):
+            _walk_json_ld(child, candidates)
+
+
+def extract_structured_prices(soup: BeautifulSoup) -> List[Dict[str, Any]]:
+    """
+    Harvest prices from JSON-LD, microdata and price meta tags.
+
+    Must run on the raw page, before clean_html removes script and meta elements.
+
+    Returns:
+        List of {"value", "currency", "source"} candidates in document order per source
+    """
+    candidates: List[Dict[str, Any]] = []
+
+    # JSON-LD: Offer.price / priceCurrency
+    for script in soup.find_all("script", type="application/ld+json"):
+        try:
+            data = json.loads(script.string or script.get_text() or "")
+        except (json.JSONDecodeError, TypeError):
+            continue
+        _walk_json_ld(data, candidates)
+
+    # Microdata: itemprop="price" with a sibling itemprop="priceCurrency" in the same item
+    for tag in soup.find_all(attrs={"itemprop": "price"}):
+        value = _to_price(tag.get("content") or tag.get_text(" "))
+        if value is None:
+            continue
+        scope = tag.find_parent(attrs={"itemscope": True}) or soup
+        currency_tag = scope.find(attrs={"itemprop": "priceCurrency"})
+        currency = None
+        if currency_tag is not None:
+            currency = _to_currency(currency_tag.get("content") or currency_tag.get_text(" "))
+        candidates.append({"value": value, "currency": currency, "source": "microdata"})
+
+    # Meta tags: og:price:amount / product:price:amount
+    for amount_name, currency_name in PRICE_META_TAGS.items():
+        for tag in soup.find_all("meta", attrs={"property": amount_name}):
+            value = _to_price(tag.get("content"))
+            if value is None:
+                continue
+            currency_tag = soup.find("meta", attrs={"property": currency_name})
+            currency = _to_currency(currency_tag.get("content")) if currency_tag is not None else None
+            candidates.append({"value": value, "currency": currency, "source": "meta"})
+
+    return candidates
+
+
+def _visible_near_button(button: Tag, value: float) -> bool:
+    """Check whether the value is shown in the button's surrounding markup."""
+    node = button
+    for _ in range(MAX_LEVELS_UP):
+        node = node.parent
+        if node is None or node.name == "[document]":
+            return False
+        # Only currency-marked prices confirm it, so "Qty 1" can't confirm a price of 1
+        if value in extract_currency_prices(node.get_text(" ")):
+            return True
+    return False
+
+
+def resolve_structured_price(
+    candidates: List[Dict[str, Any]],
+    soup: BeautifulSoup,
+    button_text: str
+) -> Optional[Dict[str, Any]]:
+    """
+    Return the structured price if it unambiguously belongs to the clicked button.
+
+    All candidates must agree on a single value and currency, the button must be
+    uniquely identified, and the value must be visible near the button.
+    """
+    if not candidates:
+        return None
+
+    values = {c["value"] for c in candidates}
+    currencies = {c["currency"] for c in candidates if c["currency"]}
+    if len(values) != 1 or len(currencies) > 1:
+        return None
+
+    buttons = find_buttons(soup, button_text)
+    if len(buttons) != 1:
+        return None
+
+    value = values.pop()
+    if not _visible_near_button(buttons[0], value):
+        return None
+
+    return {
+        "value": value,
+        "currency": currencies.pop() if currencies else None,
+        "sources": sorted({c["source"] for c in candidates}),
+    }
+
+
+def format_structured_hint(candidates: List[Dict[str, Any]]) -> Optional[str]:
+    """Format structured price candidates as a compact hint line for the model."""
+    if not candidates:
+        return None
+    seen = []
+    for c in candidates:
+        value = f"{c['value']:f}".rstrip("0").rstrip(".")
+        entry = f"{value} {c['currency'] or '?'} ({c['source']})"
+        if entry not in seen:
+            seen.append(entry)
+    return "; ".join(seen)
@@ -0,0 +1,320 @@
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+import atexit
+import json
+import os
+import threading
+import time
+
+from bs4 import BeautifulSoup, NavigableString, Tag
+
+try:
+    import fcntl
+except ImportError:  # Windows: saves are still atomic, but not serialized across processes
+    fcntl = None
+
+from utils.html_parser import detect_currency, extract_currency_prices, find_buttons
+
+# How far up from the button we look for the element holding the value
+MAX_LEVELS_UP = 6
+
+# How long deletions are remembered in the template file, so processes holding
+# an older copy of a deleted template don't write it back
+TOMBSTONE_TTL_SECONDS = 7 * 24 * 3600
+
+
+def domain_from_url(page_url: Optional[str]) -> Optional[str]:
+    """Extract the host of a page URL, without a leading "www."."""
+    if not page_url:
+        return None
+    host = urlparse(page_url if "//" in page_url else f"//{page_url}").hostname
+    if not host:
+        return None
+    return host[4:] if host.startswith("www.") else host
+
+
+def _path_from(ancestor: Tag, target: Tag) -> List[List[Any]]:
+    """Describe the path from `ancestor` down to `target` as (tag name, index among same-name siblings) steps."""
+    steps = []
+    node = target
+    while node is not ancestor:
+        parent = node.parent
+        same_name = parent.find_all(node.name, recursive=False)
+        steps.append([node.name, same_name.index(node)])
+        node = parent
+    steps.reverse()
+    return steps
+
+
+def derive_locator(button: Tag, value: float) -> Optional[Dict[str, Any]]:
+    """
+    Derive a structural locator for the element holding `value`, relative to the button.
+
+    The closest ancestor of the button containing the value is used as the anchor,
+    so the locator stays valid on pages sharing the same markup.
+    """
+    ancestor = button
+    for levels_up in range(1, MAX_LEVELS_UP + 1):
+        ancestor = ancestor.parent
+        if ancestor is None or ancestor.name == "[document]":
+            return None
+
+        for text_node in ancestor.find_all(string=True):
+            if not isinstance(text_node, NavigableString) or text_node.parent is None:
+                continue
+            # Only currency-marked prices, so a template never points at ratings or quantities
+            if value in extract_currency_prices(str(text_node)):
+                target = text_node.parent
+                return {
+                    "up": levels_up,
+                    "down": _path_from(ancestor, target),
+                    "classes": sorted(target.get("class", [])),
+                }
+    return None
+
+
+def apply_locator(button: Tag, locator: Dict[str, Any]) -> Optional[Tag]:
+    """Resolve a locator from the given button, returning the target element if the structure matches."""
+    node = button
+    for _ in range(locator["up"]):
+        node = node.parent
+        if node is None:
+            return None
+
+    for name, index in locator["down"]:
+        children = node.find_all(name, recursive=False)
+        if index >= len(children):
+            return None
+        node = children[index]
+
+    # Class names are a cheap check that we landed on the same kind of element
+    if locator["classes"] and sorted(node.get("class", [])) != locator["classes"]:
+        return None
+    return node
+
+
+class TemplateStore:
+    """
+    Learned per-domain extraction templates persisted as a local JSON file.
+
+    Templates are keyed by domain and button label. Each template keeps hit/failure
+    counts and is dropped once it fails too often. Learned templates are written
+    right away; hit/failure counts are written at most every `flush_interval` seconds.
+
+    Several processes can share one file: saves merge with what is on disk under a
+    file lock (the most recently updated version of a template wins), and every
+    `flush_interval` seconds a process picks up templates learned by the others.
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        max_consecutive_failures: int = 3,
+        min_attempts: int = 10,
+        min_hit_rate: float = 0.5,
+        flush_interval: Optional[float] = None
+    ):
+        self.path = path or os.getenv("TEMPLATE_STORE_PATH", ".cache/extraction_templates.json")
+        self.max_consecutive_failures = max_consecutive_failures
+        self.min_attempts = min_attempts
+        self.min_hit_rate = min_hit_rate
+        self.flush_interval = flush_interval if flush_interval is not None else float(os.getenv("TEMPLATE_FLUSH_INTERVAL", "30"))
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._last_sync = time.monotonic()
+        self.templates: Dict[str, Dict[str, Any]] = {}
+        # Deleted keys with their deletion time, shared through the file
+        self.deleted: Dict[str, float] = {}
+        self._merge(*self._load())
+        atexit.register(self.flush)
+
+    def _load(self) -> Tuple[Dict[str, Dict[str, Any]], Dict[str, float]]:
+        """
+        Load templates and deletions from disk, starting empty if the file is missing or unreadable.
+
+        Returns:
+            Tuple of (templates, deletion times by key)
+        """
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return {}, {}
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"Error loading templates: {str(e)}")
+            return {}, {}
+        if "templates" not in data:
+            # Files written before deletions were tracked hold the templates only
+            return data, {}
+        return data["templates"], data.get("deleted", {})
+
+    def _merge(self, templates: Dict[str, Dict[str, Any]], deleted: Dict[str, float]) -> None:
+        """
+        Merge templates and deletions from disk into memory.
+
+        The most recently updated version of a template wins, and a deletion wins over
+        any version updated before it.
+        """
+        cutoff = time.time() - TOMBSTONE_TTL_SECONDS
+        for key, deleted_at in deleted.items():
+            if deleted_at > self.deleted.get(key, 0.0):
+                self.deleted[key] = deleted_at
+        self.deleted = {key: deleted_at for key, deleted_at in self.deleted.items() if deleted_at >= cutoff}
+
+        for key, template in templates.items():
+            current = self.templates.get(key)
+            if current is None or template["updated"] > current["updated"]:
+                self.templates[key] = template
+        for key, deleted_at in self.deleted.items():
+            template = self.templates.get(key)
+            if template is not None and template["updated"] <= deleted_at:
+                del self.templates[key]
+
+    def _save(self) -> None:
+        """Merge with the file on disk and write the result atomically (call with the lock held)."""
+        self._dirty = False
+        self._last_sync = time.monotonic()
+        try:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(f"{self.path}.lock", "a") as lock_file:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                self._merge(*self._load())
+                # Per-process temp file, so concurrent writers never replace each other's
+                tmp_path = f"{self.path}.{os.getpid()}.tmp"
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump({"templates": self.templates, "deleted": self.deleted}, f, indent=2)
+                os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"Error saving templates: {str(e)}")
+
+    def _maybe_sync(self) -> None:
+        """Every flush_interval seconds, write pending counts or pick up other processes' templates (lock held)."""
+        if time.monotonic() - self._last_sync < self.flush_interval:
+            return
+        if self._dirty:
+            self._save()
+        else:
+            self._last_sync = time.monotonic()
+            self._merge(*self._load())
+
+    def flush(self) -> None:
+        """Write pending hit/failure counts to disk."""
+        with self._lock:
+            if self._dirty:
+                self._save()
+
+    @staticmethod
+    def _key(domain: str, button_text: str) -> str:
+        return f"{domain}|{' '.join(button_text.split()).lower()}"
+
+    def lookup(self, domain: str, button_text: str, soup: BeautifulSoup) -> Optional[Dict[str, Any]]:
+        """
+        Try the learned template for this domain and button.
+
+        Returns:
+            Dict with "value" and "currency" on a hit, None on a miss or failed validation
+        """
+        key = self._key(domain, button_text)
+        with self._lock:
+            self._maybe_sync()
+            template = self.templates.get(key)
+        if template is None:
+            return None
+
+        result = None
+        buttons = find_buttons(soup, button_text)
+        if len(buttons) == 1:
+            target = apply_locator(buttons[0], template["locator"])
+            if target is not None:
+                text = target.get_text(" ")
+                prices = extract_currency_prices(text)
+                # A hit needs exactly one price (several, as on a sale "was/now" price, are
+                # ambiguous) marked with the same currency the template was learned with
+                if len(set(prices)) == 1 and detect_currency(text) == template.get("currency"):
+                    result = {
+                        "value": prices[0],
+                        "currency": template["currency"],
+                    }
+
+        with self._lock:
+            template = self.templates.get(key)
+            if template is None:
+                return result
+            if result is not None:
+                template["hits"] += 1
+                template["consecutive_failures"] = 0
+            else:
+                template["failures"] += 1
+                template["consecutive_failures"] += 1
+                if self._should_invalidate(template):
+                    print(f"Invalidating extraction template for {key}")
+                    del self.templates[key]
+                    self.deleted[key] = time.time()
+            template["updated"] = time.time()
+            self._dirty = True
+            self._maybe_sync()
+        return result
+
+    def _should_invalidate(self, template: Dict[str, Any]) -> bool:
+        """Decide whether a template fails too often to keep using it."""
+        if template["consecutive_failures"] >= self.max_consecutive_failures:
+            return True
+        attempts = template["hits"] + template["failures"]
+        return attempts >= self.min_attempts and template["hits"] / attempts < self.min_hit_rate
+
+    def learn(
+        self,
+        domain: str,
+        button_text: str,
+        soup: BeautifulSoup,
+        value: Optional[float],
+        currency: Optional[str]
+    ) -> bool:
+        """
+        Learn (or re-learn) a template from a value the model returned.
+
+        Only values with a currency that can be found, currency-marked, near a uniquely
+        identified button are learned.
+
+        Returns:
+            True if a template was stored
+        """
+        if value is None or currency is None:
+            return False
+        buttons = find_buttons(soup, button_text)
+        if len(buttons) != 1:
+            return False
+        locator = derive_locator(buttons[0], value)
+        if locator is None:
+            return False
+
+        key = self._key(domain, button_text)
+        now = time.time()
+        with self._lock:
+            previous = self.templates.get(key, {})
+            self.templates[key] = {
+                "locator": locator,
+                "currency": currency,
+                "hits": previous.get("hits", 0),
+                "failures": previous.get("failures", 0),
+                "consecutive_failures": 0,
+                "created": previous.get("created", now),
+                "updated": now,
+            }
+            self._save()
+        return True
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Hit-rate statistics for every stored template."""
+        with self._lock:
+            return {
+                key: {
+                    "hits": t["hits"],
+                    "failures": t["failures"],
+                    "hit_rate": t["hits"] / (t["hits"] + t["failures"]) if t["hits"] + t["failures"] else None,
+                }
+                for key, t in self.templates.items()
+            }
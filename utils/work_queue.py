@@ -0,0 +1,208 @@
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, Tuple
+import json
+import os
+import sqlite3
+import time
+
+# Job states: waiting, held by a worker, finished, or given up after too many attempts
+JOB_PENDING = "pending"
+JOB_LEASED = "leased"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    worker TEXT,
+    lease_expires REAL,
+    result TEXT,
+    error TEXT,
+    created REAL NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, id);
+"""
+
+
+class WorkQueue:
+    """
+    Durable local job queue backed by SQLite.
+
+    Workers lease jobs for a limited time and ack them with a result. Leases of
+    crashed workers expire and their jobs become available again, so work
+    survives restarts. Safe to use from several processes at once.
+    """
+
+    def __init__(self, path: Optional[str] = None, max_attempts: int = 3):
+        self.path = path or os.getenv("QUEUE_PATH", ".cache/work_queue.sqlite3")
+        self.max_attempts = max_attempts
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        # One short-lived connection per operation keeps the queue safe across threads and processes
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA busy_timeout=30000")
+            yield conn
+        finally:
+            conn.close()
+
+    def enqueue(self, payload: Dict[str, Any]) -> int:
+        """Add a job and return its ID."""
+        now = time.time()
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "INSERT INTO jobs (payload, status, created, updated) VALUES (?, ?, ?, ?)",
+                (json.dumps(payload), JOB_PENDING, now, now)
+            )
+            return cursor.lastrowid
+
+    def enqueue_many(self, payloads: List[Dict[str, Any]]) -> List[int]:
+        """Add several jobs in one transaction and return their IDs."""
+        now = time.time()
+        ids = []
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            for payload in payloads:
+                cursor = conn.execute(
+                    "INSERT INTO jobs (payload, status, created, updated) VALUES (?, ?, ?, ?)",
+                    (json.dumps(payload), JOB_PENDING, now, now)
+                )
+                ids.append(cursor.lastrowid)
+            conn.execute("COMMIT")
+        return ids
+
+    def lease(self, worker: str, limit: int = 1, lease_seconds: float = 120.0) -> List[Tuple[int, Dict[str, Any]]]:
+        """
+        Claim up to `limit` pending jobs (or jobs whose lease expired).
+
+        Expired jobs that already used up max_attempts are marked failed instead.
+
+        Returns:
+            List of (job ID, payload)
+        """
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            # A job whose lease keeps expiring likely crashes its worker; give up on it like on fail()
+            conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, lease_expires = NULL, updated = ? "
+                "WHERE status = ? AND lease_expires < ? AND attempts >= ?",
+                (JOB_FAILED, "Lease expired on the last attempt (worker crashed or timed out)",
+                 now, JOB_LEASED, now, self.max_attempts)
+            )
+            rows = conn.execute(
+                "SELECT id, payload FROM jobs "
+                "WHERE status = ? OR (status = ? AND lease_expires < ?) "
+                "ORDER BY id LIMIT ?",
+                (JOB_PENDING, JOB_LEASED, now, limit)
+            ).fetchall()
+            for job_id, _ in rows:
+                conn.execute(
+                    "UPDATE jobs SET status = ?, worker = ?, lease_expires = ?, attempts = attempts + 1, updated = ? "
+                    "WHERE id = ?",
+                    (JOB_LEASED, worker, now + lease_seconds, now, job_id)
+                )
+            conn.execute("COMMIT")
+        return [(job_id, json.loads(payload)) for job_id, payload in rows]
+
+    def renew(self, job_id: int, worker: str, lease_seconds: float) -> bool:
+        """
+        Extend the lease of a job still running on `worker`.
+
+        Returns:
+            False if the worker no longer holds the lease
+        """
+        now = time.time()
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET lease_expires = ?, updated = ? WHERE id = ? AND status = ? AND worker = ?",
+                (now + lease_seconds, now, job_id, JOB_LEASED, worker)
+            )
+        return cursor.rowcount > 0
+
+    def ack(self, job_id: int, worker: str, result: Dict[str, Any]) -> bool:
+        """
+        Mark a job leased by `worker` as done and store its result.
+
+        Returns:
+            False if the worker no longer holds the lease (it expired and the job was re-leased)
+        """
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, lease_expires = NULL, updated = ? "
+                "WHERE id = ? AND status = ? AND worker = ?",
+                (JOB_DONE, json.dumps(result), time.time(), job_id, JOB_LEASED, worker)
+            )
+        if cursor.rowcount == 0:
+            print(f"Ignoring result of job {job_id} from {worker}: lease no longer held")
+            return False
+        return True
+
+    def fail(self, job_id: int, worker: str, error: str) -> bool:
+        """
+        Release a job leased by `worker` after an error; it is retried until max_attempts is reached.
+
+        Returns:
+            False if the worker no longer holds the lease (it expired and the job was re-leased)
+        """
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET status = CASE WHEN attempts >= ? THEN ? ELSE ? END, "
+                "error = ?, lease_expires = NULL, updated = ? WHERE id = ? AND status = ? AND worker = ?",
+                (self.max_attempts, JOB_FAILED, JOB_PENDING, error, time.time(), job_id, JOB_LEASED, worker)
+            )
+        if cursor.rowcount == 0:
+            print(f"Ignoring failure of job {job_id} from {worker}: lease no longer held")
+            return False
+        return True
+
+    def get(self, job_id: int) -> Optional[Dict[str, Any]]:
+        """Return the status, result and error of a job."""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT id, status, attempts, result, error FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {
+            "id": row[0],
+            "status": row[1],
+            "attempts": row[2],
+            "result": json.loads(row[3]) if row[3] else None,
+            "error": row[4],
+        }
+
+    def results(self, since_id: int = 0) -> List[Dict[str, Any]]:
+        """Return finished and failed jobs with ID greater than `since_id`."""
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT id, status, payload, result, error FROM jobs WHERE id > ? AND status IN (?, ?) ORDER BY id",
+                (since_id, JOB_DONE, JOB_FAILED)
+            ).fetchall()
+        return [
+            {
+                "id": row[0],
+                "status": row[1],
+                "custom_id": json.loads(row[2]).get("custom_id"),
+                "result": json.loads(row[3]) if row[3] else None,
+                "error": row[4],
+            }
+            for row in rows
+        ]
+
+    def stats(self) -> Dict[str, int]:
+        """Number of jobs per status."""
+        with self._connect() as conn:
+            rows = conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return dict(rows)
@@ -0,0 +1,202 @@
+"""
+Queue-backed execution mode.
+
+Producers enqueue click jobs into a durable local SQLite queue; worker processes,
+each running its own event loop with the model clients, lease jobs, run them
+through the pipeline and write the results back.
+
+    python worker.py enqueue clicks.jsonl --model OpenAI
+    python worker.py run --workers 4 --concurrency 8
+    python worker.py results results.jsonl
+    python worker.py stats
+
+Input lines are {"html", "button_text"} (or "button_texts" for a multi-button job)
+with optional "custom_id", "page_url", "model" and "ultra_compact".
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import signal
+import socket
+
+from utils.work_queue import WorkQueue
+
+# Result statuses of transient failures the queue should retry
+RETRY_STATUSES = ("timeout", "error")
+
+
+async def run_job(pipeline, payload):
+    """Run one queued job through the pipeline and return its result."""
+    if "button_texts" in payload:
+        results, _, size_info = await pipeline.process_clicks(
+            payload["html"],
+            payload["button_texts"],
+            payload.get("model", "Ollama"),
+            payload.get("ultra_compact", True)
+        )
+        return {"results": results, "size_info": size_info}
+
+    result, _, size_info, _ = await pipeline.process_click(
+        payload["html"],
+        payload["button_text"],
+        payload.get("model", "Ollama"),
+        payload.get("ultra_compact", True),
+        payload.get("page_url", "")
+    )
+    return {"result": result, "size_info": size_info}
+
+
+def failure_reason(output) -> str:
+    """Describe why a job's result should be retried, or return "" if it succeeded."""
+    results = output["results"] if "results" in output else [output["result"]]
+    for result in results:
+        if "error" in result:
+            return result["error"]
+        if result.get("status") in RETRY_STATUSES:
+            return f"Evaluation ended with status {result['status']}"
+    return ""
+
+
+async def work(name: str, queue: WorkQueue, concurrency: int, lease_seconds: float, poll_interval: float) -> None:
+    """Lease and run jobs until SIGTERM/SIGINT, then finish the jobs in flight."""
+    # Imported here so every worker process initializes its own model clients
+    import pipeline
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
+
+    async def keep_leased(job_id):
+        # Renew well before expiry so a long job isn't leased and run a second time
+        while True:
+            await asyncio.sleep(lease_seconds / 3)
+            if not await asyncio.to_thread(queue.renew, job_id, name, lease_seconds):
+                print(f"[{name}] Lost the lease of job {job_id}")
+                return
+
+    async def handle(job_id, payload):
+        heartbeat = asyncio.create_task(keep_leased(job_id))
+        try:
+            result = await run_job(pipeline, payload)
+            reason = failure_reason(result)
+            if reason:
+                # Timeouts and provider errors are transient; let the queue retry them
+                print(f"[{name}] Job {job_id} failed: {reason}")
+                await asyncio.to_thread(queue.fail, job_id, name, reason)
+            else:
+                await asyncio.to_thread(queue.ack, job_id, name, result)
+        except Exception as e:
+            print(f"[{name}] Job {job_id} failed: {str(e)}")
+            await asyncio.to_thread(queue.fail, job_id, name, str(e))
+        finally:
+            heartbeat.cancel()
+
+    in_flight = set()
+    while not stop.is_set():
+        free = concurrency - len(in_flight)
+        jobs = await asyncio.to_thread(queue.lease, name, free, lease_seconds) if free > 0 else []
+        for job_id, payload in jobs:
+            in_flight.add(asyncio.create_task(handle(job_id, payload)))
+
+        if in_flight:
+            done, _ = await asyncio.wait(in_flight, timeout=poll_interval, return_when=asyncio.FIRST_COMPLETED)
+            in_flight -= done
+        else:
+            try:
+                await asyncio.wait_for(stop.wait(), poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    if in_flight:
+        print(f"[{name}] Finishing {len(in_flight)} jobs before exiting")
+        await asyncio.gather(*in_flight)
+
+
+def worker_process(index: int, queue_path: str, concurrency: int, lease_seconds: float, poll_interval: float) -> None:
+    """Entry point of a worker process."""
+    name = f"{socket.gethostname()}-{os.getpid()}-{index}"
+    queue = WorkQueue(queue_path)
+
+    import pipeline
+    pipeline.warm_up_models()
+
+    print(f"[{name}] Started with concurrency {concurrency}")
+    asyncio.run(work(name, queue, concurrency, lease_seconds, poll_interval))
+    print(f"[{name}] Stopped")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Durable local work queue for click evaluation")
+    parser.add_argument("--queue", default=os.getenv("QUEUE_PATH", ".cache/work_queue.sqlite3"), help="SQLite queue file")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    enqueue_parser = subparsers.add_parser("enqueue", help="Add jobs from a JSONL file")
+    enqueue_parser.add_argument("input")
+    enqueue_parser.add_argument("--model", default="Ollama", help="Model used when a line doesn't set one")
+
+    run_parser = subparsers.add_parser("run", help="Start worker processes")
+    run_parser.add_argument("--workers", type=int, default=int(os.getenv("QUEUE_WORKERS", str(os.cpu_count() or 1))))
+    run_parser.add_argument("--concurrency", type=int, default=int(os.getenv("QUEUE_CONCURRENCY", "4")), help="Jobs in flight per worker")
+    run_parser.add_argument("--lease-seconds", type=float, default=float(os.getenv("REQUEST_DEADLINE", "45")) + 30)
+    run_parser.add_argument("--poll-interval", type=float, default=0.5)
+
+    results_parser = subparsers.add_parser("results", help="Write finished jobs to a JSONL file")
+    results_parser.add_argument("output")
+    results_parser.add_argument("--since-id", type=int, default=0)
+
+    subparsers.add_parser("stats", help="Show job counts per status")
+
+    args = parser.parse_args()
+    queue = WorkQueue(args.queue)
+
+    if args.command == "enqueue":
+        payloads = []
+        with open(args.input, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    payload = json.loads(line)
+                    payload.setdefault("model", args.model)
+                    payloads.append(payload)
+        ids = queue.enqueue_many(payloads)
+        print(f"Enqueued {len(ids)} jobs" + (f" (IDs {ids[0]}-{ids[-1]})" if ids else ""))
+
+    elif args.command == "run":
+        # Spawn (rather than fork) so each worker builds fresh clients and event loops
+        context = multiprocessing.get_context("spawn")
+        processes = [
+            context.Process(
+                target=worker_process,
+                args=(i, queue.path, args.concurrency, args.lease_seconds, args.poll_interval)
+            )
+            for i in range(args.workers)
+        ]
+        for process in processes:
+            process.start()
+
+        def stop_workers(signum, frame):
+            # Workers stop leasing and finish their in-flight jobs on SIGTERM
+            for process in processes:
+                if process.is_alive():
+                    os.kill(process.pid, signal.SIGTERM)
+
+        signal.signal(signal.SIGINT, stop_workers)
+        signal.signal(signal.SIGTERM, stop_workers)
+        for process in processes:
+            process.join()
+
+    elif args.command == "results":
+        results = queue.results(args.since_id)
+        with open(args.output, "w", encoding="utf-8") as f:
+            for result in results:
+                f.write(json.dumps(result) + "\n")
+        print(f"Wrote {len(results)} results to {args.output}")
+
+    else:
+        print(json.dumps(queue.stats()))
+
+
+if __name__ == "__main__":
+    main()